@@ -0,0 +1,115 @@
+from collections import deque
+import json
+import os
+from random import random
+import sys
+from threading import Thread, Event
+
+from Lock import getCounter
+
+# Structured access log, one JSON object per line. Request threads only append entries to a shared deque (no lock is
+# taken); a background thread writes them out in batches every flushInterval seconds, or sooner once batchSize
+# entries are waiting. The file rotates at maxBytes, keeping backupCount old files (access.log.1, .2, ...).
+# If more than maxQueue entries are waiting, new entries are dropped and counted rather than blocking the request.
+# sampling maps routes (the index exactly as passed to @get/@post) to the fraction of their requests to log.
+#
+#   server.accessLog = AccessLog('access.log', sampling = {'status': 0.01})
+class AccessLog:
+	def __init__(self, filename = 'access.log', maxBytes = 10 * 1024 * 1024, backupCount = 5, batchSize = 256, flushInterval = 1.0, maxQueue = 10000, sampling = None):
+		self.filename = filename
+		self.maxBytes = maxBytes
+		self.backupCount = backupCount
+		self.batchSize = batchSize
+		self.flushInterval = flushInterval
+		self.maxQueue = maxQueue
+		self.sampling = sampling or {}
+		self.entries = deque()
+		self.written, self.dropped, self.sampledOut = getCounter(), getCounter(), getCounter()
+		self.wake = Event()
+		self.running = True
+		self.f = None
+		self.writer = Thread(name = "access log <%s>" % filename, target = self.run)
+		self.writer.daemon = True
+		self.writer.start()
+
+	def record(self, entry):
+		rate = self.sampling.get(entry.get('route'))
+		if rate is not None:
+			if random() >= rate:
+				self.sampledOut.inc()
+				return
+			entry['sample'] = rate
+
+		if len(self.entries) >= self.maxQueue:
+			self.dropped.inc()
+			return
+		self.entries.append(entry)
+		if len(self.entries) >= self.batchSize:
+			self.wake.set()
+
+	def run(self):
+		while self.running:
+			self.wake.wait(self.flushInterval)
+			self.wake.clear()
+			self.flush()
+		self.flush()
+		if self.f:
+			self.f.close()
+
+	# Only called from the writer thread
+	def flush(self):
+		batch = []
+		try:
+			while True:
+				batch.append(self.entries.popleft())
+		except IndexError:
+			pass
+		if not batch:
+			return
+
+		lines = []
+		for entry in batch:
+			try:
+				lines.append(json.dumps(entry, separators = (',', ':')) + '\n')
+			except Exception, e:
+				self.dropped.inc()
+				sys.stderr.write("Unable to serialize access log entry %r: %s\n" % (entry, e))
+		if not lines:
+			return
+
+		try:
+			if self.f is None:
+				self.f = open(self.filename, 'a')
+			self.f.write(''.join(lines))
+			self.f.flush()
+			self.written += len(lines)
+			if self.maxBytes and self.f.tell() >= self.maxBytes:
+				self.rotate()
+		except (IOError, OSError), e:
+			self.dropped += len(lines)
+			sys.stderr.write("Unable to write access log %s: %s\n" % (self.filename, e))
+
+	def rotate(self):
+		self.f.close()
+		self.f = None
+		if self.backupCount > 0:
+			for i in range(self.backupCount - 1, 0, -1):
+				src = "%s.%d" % (self.filename, i)
+				if os.path.exists(src):
+					os.rename(src, "%s.%d" % (self.filename, i + 1))
+			os.rename(self.filename, "%s.1" % self.filename)
+		else:
+			os.remove(self.filename)
+
+	def metrics(self):
+		return {
+			'queued': len(self.entries),
+			'written': self.written.count,
+			'dropped': self.dropped.count,
+			'sampledOut': self.sampledOut.count,
+		}
+
+	def close(self):
+		self.running = False
+		self.wake.set()
+		self.writer.join()
@@ -0,0 +1,353 @@
+import asynchat
+import asyncore
+from collections import deque
+import errno
+import fcntl
+from heapq import heappush, heappop
+from itertools import count
+import os
+from Queue import Full
+import re
+import socket
+from StringIO import StringIO
+import sys
+import time
+import traceback
+
+import Background
+import Session
+from EventStream import getHub
+from Executor import Executor, Future
+from RateLimit import tooManyRequests
+from RequestLimits import RequestLimits, RequestTimeout, RequestTooLarge, HeadersTooLarge
+from ResponseWriter import setContext
+
+# An alternative to HTTPServer that reads requests on a single event loop instead of a thread per connection.
+# Complete requests are run by the same handler class on a bounded pool of worker threads; generator handlers
+# are stepped on the loop thread between the futures they yield, so a handler waiting on I/O holds no thread.
+# Once one finishes, its page is rendered and its session saved back on a worker.
+#
+#   server = AsyncHTTPServer(('', 8000), HTTPHandler, workers = 16)
+#   server.serve_forever()
+#
+#   @get('report')
+#   def report(handler):
+#       rows = yield handler.server.executor.submit(db.query, ...)
+#       yield handler.server.sleep(0.5)
+#       print ...
+class AsyncHTTPServer:
+	coroutines = True # HTTPHandler leaves generator handlers for the loop to drive
+	admission = None # Set to a RateLimit.AdmissionController to limit request rates
+	drainTimeout = 10 # Seconds server_close() waits for deferred background tasks to finish
+	accessLog = None # Set to an AccessLog.AccessLog to log requests there instead of stderr
+	preloadSessions = False # Unpickle the session file on a background thread at start-up instead of on first use
+	tcpNoDelay = True # Each response is pushed as one buffer, so Nagle's algorithm would only delay it
+
+	def __init__(self, server_address, RequestHandlerClass, workers = 16, maxQueue = 256):
+		self.RequestHandlerClass = RequestHandlerClass
+		self.limits = RequestLimits()
+		self.executor = Executor(workers, maxQueue, 'request')
+		self.map = {}
+		self.ready = deque()
+		self.timers = []
+		self.timerIDs = count()
+		self.taskIDs = count(1)
+		self.running = False
+		self.waker = Waker(self.map)
+		self.listener = Listener(self, server_address)
+		self.server_address = self.listener.socket.getsockname()
+		if self.preloadSessions:
+			Session.preload()
+
+	def serve_forever(self):
+		self.running = True
+		while self.running:
+			timeout = 30.0
+			if self.ready:
+				timeout = 0
+			elif self.timers:
+				timeout = max(0, min(timeout, self.timers[0][0] - time.time()))
+			asyncore.loop(timeout, True, self.map, 1)
+			self.runReady()
+
+	def shutdown(self):
+		self.running = False
+		self.waker.wake()
+
+	def server_close(self):
+		self.listener.close()
+		self.executor.shutdown(False)
+		Background.drain(self.drainTimeout)
+		if self.accessLog is not None:
+			self.accessLog.close()
+
+	# Schedules fn to run on the loop thread; safe to call from any thread
+	def callSoon(self, fn, *args):
+		self.ready.append((fn, args))
+		self.waker.wake()
+
+	def callLater(self, delay, fn, *args):
+		self.callSoon(self.addTimer, time.time() + delay, fn, args)
+
+	def addTimer(self, when, fn, args):
+		heappush(self.timers, (when, next(self.timerIDs), fn, args))
+
+	def sleep(self, seconds):
+		future = Future()
+		self.callLater(seconds, future.setResult, None)
+		return future
+
+	def runReady(self):
+		now = time.time()
+		while self.timers and self.timers[0][0] <= now:
+			_, _, fn, args = heappop(self.timers)
+			self.ready.append((fn, args))
+		for i in range(len(self.ready)):
+			fn, args = self.ready.popleft()
+			try:
+				fn(*args)
+			except:
+				self.handle_error(None, None)
+
+	def accept(self, sock, addr):
+		if self.admission is not None:
+			wait = self.admission.checkAddress(addr[0])
+			if wait:
+				try:
+					sock.send(tooManyRequests(wait))
+				except socket.error:
+					pass
+				sock.close()
+				return
+		if self.tcpNoDelay:
+			sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		Connection(self, sock, addr)
+
+	def dispatch(self, conn, data):
+		try:
+			self.executor.submit(self.serve, conn, data)
+		except Full:
+			conn.respond(emptyResponse(503, 'Service Unavailable'))
+
+	# Runs on a worker thread; the handler writes its response into a buffer that the loop then sends
+	def serve(self, conn, data):
+		task = ('task', next(self.taskIDs))
+		request = BufferedRequest(data)
+		setContext(task)
+		try:
+			handler = self.RequestHandlerClass(request, conn.addr, self)
+		except:
+			self.handle_error(None, conn.addr)
+			handler = None
+			Background.pending.pop(task, None)
+		finally:
+			setContext(None)
+
+		if handler is not None and handler.coroutine is not None:
+			self.callSoon(self.step, handler, conn, task)
+		elif handler is not None and handler.streaming:
+			self.callSoon(self.stream, conn, handler)
+		elif handler is not None:
+			self.callSoon(conn.respond, handler.wfile.getvalue(), handler.requestFinished)
+		else:
+			self.callSoon(conn.respond, request.output.getvalue()) # Whatever error page the handler managed to write
+
+	# Runs on the loop thread each time a generator handler can make progress
+	def step(self, handler, conn, task, value = None, excInfo = None):
+		setContext(task)
+		try:
+			handler.resume(value, excInfo)
+		except:
+			self.handle_error(None, conn.addr)
+			conn.respond(handler.wfile.getvalue(), handler.requestFinished)
+			return
+		finally:
+			setContext(None)
+
+		if handler.coroutine is None:
+			try:
+				self.executor.submit(self.complete, handler, conn, task)
+			except Full:
+				self.complete(handler, conn, task)
+		elif handler.pending is None:
+			self.callSoon(self.step, handler, conn, task)
+		else:
+			try:
+				self.wait(handler.pending).addCallback(lambda future: self.callSoon(self.step, handler, conn, task, *future.outcome()))
+			except:
+				# Whatever was yielded can't be waited on; the handler gets the error instead
+				self.callSoon(self.step, handler, conn, task, None, sys.exc_info())
+
+	# Runs once a generator handler has finished, normally on a worker thread
+	def complete(self, handler, conn, task):
+		setContext(task)
+		try:
+			handler.completeCoroutine()
+		except:
+			self.handle_error(None, conn.addr)
+		finally:
+			setContext(None)
+		self.callSoon(conn.respond, handler.wfile.getvalue(), handler.requestFinished)
+
+	# Handlers may yield anything with a blocking result(); ones without addCallback() are waited on by a worker thread
+	def wait(self, pending):
+		if hasattr(pending, 'addCallback'):
+			return pending
+		return self.executor.submit(pending.result)
+
+	# Moves an event stream's connection off the loop and onto the event hub
+	def stream(self, conn, handler):
+		sock = conn.detach()
+		if sock is not None:
+			getHub().add(sock, handler.wfile.getvalue(), *handler.streaming)
+		handler.requestFinished()
+
+	def handle_error(self, request, client_address):
+		sys.stderr.write("%s\nException happened during processing of request from %s\n%s%s\n" % ('-' * 40, client_address, traceback.format_exc(), '-' * 40))
+
+class Listener(asyncore.dispatcher):
+	def __init__(self, server, address):
+		asyncore.dispatcher.__init__(self, map = server.map)
+		self.server = server
+		self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.set_reuse_addr()
+		self.bind(address)
+		self.listen(128)
+
+	def handle_accept(self):
+		pair = self.accept()
+		if pair is not None:
+			self.server.accept(*pair)
+
+# Wakes the loop from other threads by writing to a pipe it's polling
+class Waker(asyncore.file_dispatcher):
+	def __init__(self, map):
+		r, self.w = os.pipe()
+		fcntl.fcntl(self.w, fcntl.F_SETFL, fcntl.fcntl(self.w, fcntl.F_GETFL) | os.O_NONBLOCK)
+		asyncore.file_dispatcher.__init__(self, r, map)
+
+	def wake(self):
+		try:
+			os.write(self.w, 'x')
+		except OSError, e:
+			if e.errno != errno.EAGAIN: # Pipe already full, so the loop will wake anyway
+				raise
+
+	def writable(self):
+		return False
+
+	def handle_read(self):
+		self.recv(4096)
+
+contentLengthPattern = re.compile(r'^content-length:\s*(\d+)\s*$', re.I | re.M)
+
+# Reads one request without a thread, enforcing the server's RequestLimits, then hands it to the server
+class Connection(asynchat.async_chat):
+	def __init__(self, server, sock, addr):
+		asynchat.async_chat.__init__(self, sock, server.map)
+		self.server = server
+		self.addr = addr
+		self.data = []
+		self.size = 0
+		self.reading = 'headers'
+		self.sent = None
+		self.set_terminator('\r\n\r\n')
+		limits = server.limits
+		if limits is not None:
+			timeouts = [t for t in (limits.requestLineTimeout, limits.headerTimeout, limits.bodyTimeout) if t is not None]
+			if timeouts:
+				server.callLater(sum(timeouts), self.expire)
+
+	def collect_incoming_data(self, data):
+		if self.reading not in ('headers', 'body'):
+			return
+		self.data.append(data)
+		self.size += len(data)
+		limits = self.server.limits
+		if self.reading == 'headers' and limits is not None and limits.maxHeaderSize is not None and self.size > limits.maxHeaderSize:
+			self.reject(HeadersTooLarge())
+
+	def found_terminator(self):
+		if self.reading == 'headers':
+			self.data.append(self.terminator)
+			match = contentLengthPattern.search(''.join(self.data))
+			length = int(match.group(1)) if match else 0
+			limits = self.server.limits
+			if limits is not None and limits.maxRequestSize is not None and self.size + length > limits.maxRequestSize:
+				self.reject(RequestTooLarge())
+				return
+			if length:
+				self.reading = 'body'
+				self.set_terminator(length)
+				return
+
+		self.reading = 'done'
+		self.set_terminator(None)
+		self.server.dispatch(self, ''.join(self.data))
+
+	def expire(self):
+		if self.reading in ('headers', 'body') and self.connected:
+			self.reject(RequestTimeout())
+
+	def reject(self, exc):
+		self.server.limits.record(exc)
+		self.respond(emptyResponse(exc.code, exc.message))
+
+	# sent is called once the connection closes, normally after the response has gone out
+	def respond(self, data, sent = None):
+		self.reading = 'responding'
+		self.set_terminator(None)
+		self.sent = sent
+		if self.connected:
+			self.push(data)
+			self.close_when_done()
+		else:
+			self.close()
+
+	def detach(self):
+		if not self.connected:
+			return None
+		self.reading = 'detached'
+		self.del_channel()
+		sock, self.socket = self.socket, None
+		self.connected = False
+		return sock
+
+	def close(self):
+		asynchat.async_chat.close(self)
+		sent, self.sent = self.sent, None
+		if sent is not None:
+			sent()
+
+def emptyResponse(code, message):
+	return "HTTP/1.0 %d %s\r\nContent-Length: 0\r\nConnection: close\r\n\r\n" % (code, message)
+
+# Stands in for the client socket so the handler parses a request that's already been read and buffers its response
+class BufferedRequest:
+	def __init__(self, data):
+		self.input = StringIO(data)
+		self.output = ResponseBuffer()
+
+	def makefile(self, mode = 'r', bufsize = -1):
+		return self.input if 'r' in mode else self.output
+
+	def recv(self, size):
+		return self.input.read(size)
+
+	def settimeout(self, timeout): pass
+
+class ResponseBuffer:
+	def __init__(self):
+		self.data = []
+		self.closed = False
+
+	def write(self, data):
+		self.data.append(data)
+
+	def getvalue(self):
+		return ''.join(self.data)
+
+	def flush(self): pass
+
+	# The handler closes its wfile when its request finishes, but a suspended generator handler writes its response later
+	def close(self): pass
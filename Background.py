@@ -0,0 +1,66 @@
+from Queue import Full
+import sys
+import time
+
+from Executor import Executor
+from Lock import synchronized
+from ResponseWriter import contextIdent
+
+# Work that shouldn't hold up a response. defer() during a request queues the task until that request's response has
+# been sent (handler.after() does the same); outside a request it's submitted straight away.
+# Tasks run on named background queues, each a bounded Executor created on first use by getQueue()
+
+queues = {}
+pending = {} # context ident -> tasks deferred by the request running in that context
+
+@synchronized('background-queues')
+def getQueue(name = 'default', workers = 2, maxQueue = 1000):
+	if name not in queues:
+		queues[name] = Executor(workers, maxQueue, "background <%s>" % name, logFailures = True)
+	return queues[name]
+
+def defer(fn, *args, **kw):
+	deferTo('default', fn, *args, **kw)
+
+def deferTo(queue, fn, *args, **kw):
+	tasks = pending.get(contextIdent())
+	if tasks is None:
+		submit((queue, fn, args, kw))
+	else:
+		tasks.append((queue, fn, args, kw))
+
+def submit((queue, fn, args, kw)):
+	try:
+		getQueue(queue).submit(fn, *args, **kw)
+	except Full:
+		sys.stderr.write("Background queue %s is full; dropped task %s\n" % (queue, getattr(fn, '__name__', fn)))
+
+# Called by the handler: holdDeferred() when a request starts in a context, releaseDeferred() once its response is sent
+def holdDeferred(ident):
+	tasks = pending[ident] = []
+	return tasks
+
+def releaseDeferred(ident, tasks):
+	if pending.get(ident) is tasks:
+		del pending[ident]
+	while tasks:
+		submit(tasks.pop(0))
+
+def metrics():
+	return {name: queue.metrics() for name, queue in queues.items()}
+
+# Waits for each queue to finish what it has, sharing one timeout between them; returns False if anything was still
+# queued when the timeout passed. The queues are shared by the whole process, so they keep running afterwards
+def drain(timeout = None):
+	deadline = None if timeout is None else time.time() + timeout
+	drained = True
+	for name, queue in queues.items():
+		drained = queue.drain(None if deadline is None else max(0, deadline - time.time())) and drained
+	return drained
+
+# Stops every queue's workers without waiting; tasks that don't fit ahead of the stop signals are dropped
+@synchronized('background-queues')
+def shutdown():
+	for name, queue in queues.items():
+		queue.shutdown(False)
+		del queues[name]
@@ -1,6 +1,7 @@
+from itertools import count
 from random import randint
 
-from ResponseWriter import ResponseWriter
+from Template import getTemplate
 from utils import *
 
 classnames = {
@@ -22,21 +23,20 @@ class Box:
 		self.id = id
 		self.clr = clr
 
+	template = getTemplate(
+		'<div{{#id}} id="{{id}}"{{/id}} class="box {{clr}} rounded">\n'
+		'{{#title}}<div class="title">{{{title}}}</div>\n{{/title}}'
+		'<span class="boxBody">\n{{{text}}}\n</span>\n'
+		'</div>\n'
+	)
+
 	def __str__(self):
-		writer = ResponseWriter()
-		print "<div",
-		if self.id:
-			print "id=\"%s\"" % self.id,
-		print "class=\"box %s rounded\">" % self.clr
-		if self.title:
-			print "<div class=\"title\">%s</div>" % self.title
-		print "<span class=\"boxBody\">"
-		print self.text
-		print "</span>"
-		print "</div>"
-		return writer.done()
-
-getID = id
+		return self.template.render(id = self.id, clr = self.clr, title = self.title, text = self.text)
+
+# Alert box IDs only need to be unique on the page; the per-process prefix keeps delayed boxes from an earlier run from colliding
+alertBoxPrefix = randint(268435456, 4294967295)
+alertBoxIDs = count(1)
+
 class AlertBox:
 	def __init__(self, title, text = None, id = None, close = None, fixed = False):
 		if text:
@@ -46,34 +46,27 @@ class AlertBox:
 			self.title = None
 			self.text = title
 
-		self.id = id or "alertbox-%x-%x" % (getID(self), randint(268435456, 4294967295))
+		self.id = id or "alertbox-%x-%x" % (alertBoxPrefix, next(alertBoxIDs))
 		self.close = 0 if close == True else close
 		self.fixed = fixed
 
 	def getClasses(self):
 		return [classnames['base']] + (['fixed'] if self.fixed else [])
 
+	template = getTemplate(
+		'{{#close}}<script type="text/javascript">\n'
+		'$(document).ready(function() {hidebox($(\'#{{{id}}}\'), {{close}});});\n'
+		'</script>\n{{/close}}'
+		'<div{{#id}} id="{{id}}"{{/id}} class="{{classes}}">\n'
+		'{{#closable}}<span class="close">x</span>\n{{/closable}}'
+		'<span class="boxbody">\n'
+		'{{#title}}<strong>{{{title}}}</strong>: \n{{/title}}'
+		'{{{text}}}\n</span>\n'
+		'</div>\n'
+	)
+
 	def __str__(self):
-		writer = ResponseWriter()
-
-		if self.close:
-			print "<script type=\"text/javascript\">"
-			print "$(document).ready(function() {hidebox($('#%s'), %d);});" % (self.id, self.close)
-			print "</script>"
-
-		print "<div",
-		if self.id:
-			print "id=\"%s\"" % self.id,
-		print "class=\"%s\">" % ' '.join(self.getClasses())
-		if self.close != None:
-			print "<span class=\"close\">x</span>"
-		print "<span class=\"boxbody\">"
-		if self.title:
-			print "<strong>%s</strong>: " % self.title
-		print self.text
-		print "</span>"
-		print "</div>"
-		return writer.done()
+		return self.template.render(id = self.id, close = self.close and int(self.close), closable = self.close is not None, classes = ' '.join(self.getClasses()), title = self.title, text = self.text)
 
 class InfoBox(AlertBox):
 	def __init__(self, *args, **kargs):
@@ -117,19 +110,12 @@ class CollapsibleBox:
 		self.expanded = expanded
 		self.id = id
 
+	template = getTemplate(
+		'<div{{#id}} id="{{id}}"{{/id}} class="box rounded collapsible{{#expanded}} expanded{{/expanded}}">\n'
+		'{{#title}}<div class="title">{{{title}}}</div>\n{{/title}}'
+		'<span class="boxBody">\n{{{text}}}\n</span>\n'
+		'</div>\n'
+	)
+
 	def __str__(self):
-		writer = ResponseWriter()
-		print "<div",
-		if self.id:
-			print "id=\"%s\"" % self.id,
-		print "class=\"box rounded collapsible",
-		if self.expanded:
-			print "expanded",
-		print "\">"
-		if self.title:
-			print "<div class=\"title\">%s</div>" % self.title
-		print "<span class=\"boxBody\">"
-		print self.text
-		print "</span>"
-		print "</div>"
-		return writer.done()
+		return self.template.render(id = self.id, expanded = self.expanded, title = self.title, text = self.text)
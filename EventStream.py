@@ -0,0 +1,200 @@
+from collections import defaultdict, deque
+import errno
+import fcntl
+from itertools import count
+import os
+import select
+import socket
+import sys
+from threading import Thread
+import time
+import traceback
+
+from Lock import getCounter, synchronized
+
+# Server-Sent Events. Routes registered with @stream (see HTTPHandler) send their headers and initial events, then hand
+# the socket to the EventHub: one thread that polls every open stream, so idle subscribers don't hold a request thread.
+# publish() from anywhere sends an event to every subscriber of a channel. Published events get increasing ids and the
+# last historySize per channel are kept, so a reconnecting client's Last-Event-ID header replays what it missed.
+# A comment line goes out every heartbeat seconds to keep proxies from timing idle streams out; subscribers that fall
+# more than maxBuffer bytes behind are disconnected.
+
+def formatEvent(data, event = None, id = None):
+	lines = []
+	if id is not None:
+		lines.append("id: %s" % id)
+	if event is not None:
+		lines.append("event: %s" % event)
+	lines += ["data: %s" % line for line in ('%s' % data).split('\n')]
+	return '\n'.join(lines) + '\n\n'
+
+# @stream handlers yield these (or plain strings, sent as data-only events)
+class Event:
+	def __init__(self, data, event = None, id = None):
+		self.data = data
+		self.event = event
+		self.id = id
+
+	def __str__(self):
+		return formatEvent(self.data, self.event, self.id)
+
+class Subscriber:
+	def __init__(self, sock, channels):
+		self.sock = sock
+		self.fd = sock.fileno()
+		self.channels = channels
+		self.buffer = ''
+
+class EventHub:
+	def __init__(self, heartbeat = 15, historySize = 1000, maxBuffer = 1024 * 1024):
+		self.heartbeat = heartbeat
+		self.maxBuffer = maxBuffer
+		self.subscribers = {} # fd -> Subscriber
+		self.channels = defaultdict(set) # channel -> fds
+		self.history = defaultdict(lambda: deque(maxlen = historySize)) # channel -> (id, frame)
+		self.ids = count(1)
+		self.published, self.disconnected = getCounter(), getCounter()
+
+		# Other threads only append to the inbox and write to the wake pipe; everything else happens on the hub's thread
+		self.inbox = deque()
+		self.r, self.w = os.pipe()
+		for fd in (self.r, self.w):
+			fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+		self.poller = select.poll()
+		self.poller.register(self.r, select.POLLIN)
+
+		self.thread = Thread(name = 'event hub', target = self.run)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def publish(self, channel, data, event = None):
+		self.post(self.doPublish, channel, data, event)
+
+	# Takes ownership of sock; initial is sent first, followed by anything newer than lastEventID on the channels
+	def add(self, sock, initial, channels, lastEventID = None):
+		self.post(self.doAdd, sock, initial, channels, lastEventID)
+
+	def post(self, fn, *args):
+		self.inbox.append((fn, args))
+		try:
+			os.write(self.w, 'x')
+		except OSError, e:
+			if e.errno != errno.EAGAIN:
+				raise
+
+	def metrics(self):
+		return {
+			'subscribers': len(self.subscribers),
+			'published': self.published.count,
+			'disconnected': self.disconnected.count,
+		}
+
+	def run(self):
+		nextBeat = time.time() + self.heartbeat
+		while True:
+			for fd, flags in self.poller.poll(max(0, nextBeat - time.time()) * 1000):
+				if fd == self.r:
+					try:
+						os.read(self.r, 4096)
+					except OSError:
+						pass
+					continue
+				sub = self.subscribers.get(fd)
+				if sub is None:
+					continue
+				if flags & (select.POLLIN | select.POLLHUP | select.POLLERR):
+					self.read(sub)
+				if flags & select.POLLOUT and fd in self.subscribers:
+					self.flush(sub)
+
+			while self.inbox:
+				fn, args = self.inbox.popleft()
+				try:
+					fn(*args)
+				except Exception:
+					sys.stderr.write("Event hub error:\n%s" % traceback.format_exc())
+
+			if time.time() >= nextBeat:
+				nextBeat = time.time() + self.heartbeat
+				for sub in self.subscribers.values():
+					self.send(sub, ':\n\n')
+
+	def doAdd(self, sock, initial, channels, lastEventID):
+		sock.setblocking(0)
+		sub = Subscriber(sock, channels)
+		self.subscribers[sub.fd] = sub
+		for channel in channels:
+			self.channels[channel].add(sub.fd)
+		self.poller.register(sub.fd, select.POLLIN)
+
+		if lastEventID is not None:
+			missed = sorted((id, frame) for channel in channels for (id, frame) in self.history.get(channel, ()) if id > lastEventID)
+			initial += ''.join(frame for id, frame in missed)
+		self.send(sub, initial)
+
+	def doPublish(self, channel, data, event):
+		id = next(self.ids)
+		frame = formatEvent(data, event, id)
+		self.history[channel].append((id, frame))
+		self.published.inc()
+		for fd in list(self.channels.get(channel, ())):
+			if fd in self.subscribers: # May have been dropped while sending to an earlier one
+				self.send(self.subscribers[fd], frame)
+
+	# Clients don't send anything on an event stream, so readable means closed
+	def read(self, sub):
+		try:
+			if sub.sock.recv(4096):
+				return
+		except socket.error, e:
+			if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+				return
+		self.remove(sub)
+
+	def send(self, sub, data):
+		sub.buffer += data
+		self.flush(sub)
+
+	def flush(self, sub):
+		if sub.buffer:
+			try:
+				sub.buffer = sub.buffer[sub.sock.send(sub.buffer):]
+			except socket.error, e:
+				if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+					self.remove(sub)
+					return
+		if len(sub.buffer) > self.maxBuffer:
+			self.remove(sub)
+			return
+		self.poller.modify(sub.fd, select.POLLIN | (select.POLLOUT if sub.buffer else 0))
+
+	def remove(self, sub):
+		self.poller.unregister(sub.fd)
+		del self.subscribers[sub.fd]
+		for channel in sub.channels:
+			fds = self.channels.get(channel)
+			if fds is not None:
+				fds.discard(sub.fd)
+				if not fds:
+					del self.channels[channel]
+		self.disconnected.inc()
+		try:
+			sub.sock.close()
+		except socket.error:
+			pass
+
+hub = None
+
+@synchronized('event-hub')
+def getHub():
+	global hub
+	if hub is None:
+		hub = EventHub()
+	return hub
+
+def setHub(newHub):
+	global hub
+	hub = newHub
+
+def publish(channel, data, event = None):
+	getHub().publish(channel, data, event)
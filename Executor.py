@@ -0,0 +1,146 @@
+from Queue import Queue, Empty, Full
+import sys
+from threading import Thread, Condition
+import time
+import traceback
+
+from Lock import getCounter
+
+# Set on the futures of tasks an Executor dropped without running
+class Cancelled(Exception): pass
+
+# The result of work running elsewhere. Generator handlers yield these to wait on them
+class Future:
+	def __init__(self):
+		self.condition = Condition()
+		self.finished = False
+		self.value = self.excInfo = None
+		self.callbacks = []
+
+	def setResult(self, value):
+		self.complete(value, None)
+
+	def setException(self, excInfo = None):
+		self.complete(None, excInfo or sys.exc_info())
+
+	def complete(self, value, excInfo):
+		with self.condition:
+			self.value, self.excInfo, self.finished = value, excInfo, True
+			callbacks, self.callbacks = self.callbacks, []
+			self.condition.notifyAll()
+		for callback in callbacks:
+			callback(self)
+
+	# Callbacks run on whichever thread completes the future, or immediately if it's already done
+	def addCallback(self, callback):
+		with self.condition:
+			if not self.finished:
+				self.callbacks.append(callback)
+				return
+		callback(self)
+
+	def done(self):
+		return self.finished
+
+	def outcome(self):
+		return self.value, self.excInfo
+
+	def result(self):
+		with self.condition:
+			while not self.finished:
+				self.condition.wait()
+		if self.excInfo:
+			raise self.excInfo[0], self.excInfo[1], self.excInfo[2]
+		return self.value
+
+# A fixed pool of worker threads fed from a bounded queue; submit() raises Queue.Full instead of blocking when the queue is full.
+# With logFailures, exceptions from tasks are written to stderr, for fire-and-forget work whose futures nobody checks
+class Executor:
+	def __init__(self, workers = 8, maxQueue = 0, name = 'executor', logFailures = False):
+		self.name = name
+		self.logFailures = logFailures
+		self.queue = Queue(maxQueue)
+		self.submitted, self.completed, self.failed, self.rejected, self.cancelled = getCounter(), getCounter(), getCounter(), getCounter(), getCounter()
+		self.threads = [Thread(name = "%s worker %d" % (name, i + 1), target = self.work) for i in range(workers)]
+		for t in self.threads:
+			t.daemon = True
+			t.start()
+
+	def submit(self, fn, *args, **kw):
+		future = Future()
+		try:
+			self.queue.put_nowait((future, fn, args, kw))
+		except Full:
+			self.rejected.inc()
+			raise
+		self.submitted.inc()
+		return future
+
+	def work(self):
+		while True:
+			item = self.queue.get()
+			try:
+				if item is None:
+					return
+				future, fn, args, kw = item
+				try:
+					result = fn(*args, **kw)
+				except:
+					self.failed.inc()
+					if self.logFailures:
+						sys.stderr.write("Task %s failed in %s:\n%s" % (getattr(fn, '__name__', fn), self.name, traceback.format_exc()))
+					future.setException()
+				else:
+					self.completed.inc()
+					future.setResult(result)
+			finally:
+				self.queue.task_done()
+
+	def cancelOne(self):
+		try:
+			item = self.queue.get_nowait()
+		except Empty:
+			return
+		try:
+			if item is not None:
+				future, fn, args, kw = item
+				self.cancelled.inc()
+				future.setException((Cancelled, Cancelled("%s shut down before running %s" % (self.name, getattr(fn, '__name__', fn))), None))
+		finally:
+			self.queue.task_done()
+
+	def metrics(self):
+		return {
+			'workers': len(self.threads),
+			'queued': self.queue.qsize(),
+			'submitted': self.submitted.count,
+			'completed': self.completed.count,
+			'failed': self.failed.count,
+			'rejected': self.rejected.count,
+			'cancelled': self.cancelled.count,
+		}
+
+	# Waits for everything already queued to finish; returns False if timeout passes first
+	def drain(self, timeout = None):
+		deadline = None if timeout is None else time.time() + timeout
+		with self.queue.all_tasks_done:
+			while self.queue.unfinished_tasks:
+				remaining = None if deadline is None else deadline - time.time()
+				if remaining is not None and remaining <= 0:
+					return False
+				self.queue.all_tasks_done.wait(remaining)
+		return True
+
+	# Workers stop once they reach the end of the queue. If it's too full to take their stop signals, the oldest queued
+	# tasks are dropped (their futures raise Cancelled) to make room, so this never blocks unless wait is set
+	def shutdown(self, wait = True):
+		for t in self.threads:
+			while True:
+				try:
+					self.queue.put_nowait(None)
+					break
+				except Full:
+					self.cancelOne()
+		if wait:
+			for t in self.threads:
+				t.join()
@@ -1,5 +1,4 @@
 from __future__ import with_statement
-from bleach import clean
 import os
 import traceback
 
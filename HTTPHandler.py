@@ -1,17 +1,21 @@
 from BaseHTTPServer import BaseHTTPRequestHandler
-from inspect import getargspec
 from collections import defaultdict
 import re
-import cgi
+import socket
 import sys
+import time
+from types import GeneratorType
 from urllib import unquote
 import traceback
 
-from Session import Session, timestamp
+from Session import Session, SessionView, SessionConflict, timestamp
 from Box import Box, ErrorBox
-from code import showCode
-from ResponseWriter import ResponseWriter
-from FrameworkException import FrameworkException
+from ResponseWriter import ResponseWriter, contextIdent
+from Background import holdDeferred, releaseDeferred
+from EventStream import Event
+from RateLimit import retryAfter
+from RequestLimits import RequestReader, RequestLimitExceeded
+from Lock import getLock, synchronized
 from utils import *
 
 try:
@@ -20,12 +24,85 @@ except ImportError:
 	class StasisError: pass
 
 handlers = {'get': {}, 'post': {}}
+statusLines = {} # (handler class, code) -> status line and Server header, which are the same for every response with that code
+registering = None # The registry being rebuilt by reloadHandlers(), if any
+
+# Requests are counted by the generation of handlers that was current when they arrived, so a reload can wait for the old ones
+generation = 0
+inflight = defaultdict(int)
+entered = {} # context ident -> generation of the request running in that context
+resuming = set() # Contexts whose generator handler an event loop is resuming, on the loop's own thread
+
+def routes(method):
+	return (registering or handlers)[method]
+
+@synchronized('handler-generations')
+def enterGeneration(context):
+	inflight[generation] += 1
+	entered[context] = generation
+	return generation
+
+@synchronized('handler-generations')
+def leaveGeneration(gen, context):
+	inflight[gen] -= 1
+	if inflight[gen] <= 0 and gen != generation:
+		del inflight[gen]
+	if entered.get(context) == gen:
+		del entered[context]
+
+# Re-imports the given application modules and swaps in a registry with their new routes in one step, keeping the
+# listening socket, sessions and other modules' state. Requests already dispatched finish on the old code.
+# Returns once requests that arrived before the swap have finished, or False if drainTimeout passes first; a request
+# calling it doesn't wait for itself. With wait = False it returns right after the swap, which is the only way to call
+# it from a generator handler on an event-loop server, since waiting there would block the loop
+@synchronized('reload-handlers')
+def reloadHandlers(modules, drainTimeout = 10, wait = True):
+	global handlers, registering, generation
+	context = contextIdent()
+	if wait and context in resuming:
+		raise RuntimeError("reloadHandlers() can't wait for requests on the event loop's thread; pass wait = False")
+	own = entered.get(context)
+
+	names = set(module.__name__ for module in modules)
+	staged = registering = {method: {key: handler for key, handler in registered.iteritems() if handler['fn'].__module__ not in names} for method, registered in handlers.iteritems()}
+	try:
+		for module in modules:
+			reload(module)
+	finally:
+		registering = None
+
+	with getLock('handler-generations'):
+		handlers = staged
+		old = generation
+		generation += 1
+	if not wait:
+		return None
+
+	deadline = time.time() + drainTimeout
+	while True:
+		running = sum(count - (1 if gen == own else 0) for gen, count in inflight.items() if gen <= old)
+		if running <= 0:
+			return True
+		if time.time() >= deadline:
+			sys.stderr.write("Handler reload: %d requests still running on old handlers after %ss\n" % (running, drainTimeout))
+			return False
+		time.sleep(0.05)
+
+# Reloads the given modules whenever the process gets signum, e.g. `kill -HUP`
+def reloadOnSignal(modules, signum = None, drainTimeout = 10):
+	import signal
+	from threading import Thread
+	def handle(signum, frame):
+		t = Thread(name = 'handler reload', target = reloadHandlers, args = (modules, drainTimeout))
+		t.daemon = True
+		t.start()
+	signal.signal(signal.SIGHUP if signum is None else signum, handle)
 
 @globalize
 def get(index, action = None, **kw):
 	def wrap(f):
 		kw['fn'] = f
-		handlers['get'][re.compile("^%s$" % index), action] = kw
+		routes('get')[re.compile("^%s$" % index), action] = kw
 		return f
 	return wrap
 
@@ -33,11 +110,24 @@ def get(index, action = None, **kw):
 def post(index, action = None, **kw):
 	def wrap(f):
 		kw['fn'] = f
-		handlers['post'][re.compile("^%s$" % index), action] = kw
+		routes('post')[re.compile("^%s$" % index), action] = kw
+		return f
+	return wrap
+
+# A GET route serving Server-Sent Events. The handler is a generator yielding the stream's initial events (Events or
+# strings); the connection then stays subscribed to channels (plus any added with handler.subscribe()) on the event hub
+@globalize
+def stream(index, action = None, channels = (), **kw):
+	def wrap(f):
+		kw['fn'] = f
+		kw['stream'] = (channels,) if isinstance(channels, basestring) else tuple(channels)
+		routes('get')[re.compile("^%s$" % index), action] = kw
 		return f
 	return wrap
 
 class HTTPHandler(BaseHTTPRequestHandler, object):
+	sessionConflicts = 'merge' # How this request's session writes combine with a concurrent request's; see Session.SessionView
+
 	def __init__(self, request, address, server):
 		self.session = None
 		self.replacements = {}
@@ -45,100 +135,183 @@ class HTTPHandler(BaseHTTPRequestHandler, object):
 		self.contentType = 'text/html'
 		self.forceDownload = False
 		self.responseCode = 200
-		BaseHTTPRequestHandler.__init__(self, request, address, server)
+		self.coroutine = self.pending = None
+		self.redirectedTo = None # A Redirect raised by a generator handler, until completeCoroutine() sends it
+		self.streaming = None
+		self.channels = set() # Event stream channels; see startStream()
+		self.context = contextIdent()
+		self.generation = enterGeneration(self.context)
+		self.afterResponse = holdDeferred(self.context) # Background.defer() calls made during this request
+		self.route = self.status = None
+		self.timings = {}
+		self.started = self.lastMark = time.time()
+		self.requestline = '' # Until parse_request, in case the request line is rejected
+		self.request_version = 'HTTP/1.0'
+		self.command = None
+		try:
+			BaseHTTPRequestHandler.__init__(self, request, address, server)
+		except:
+			# Event-loop servers finish requests once they've sent the response, but never get this handler back to do so
+			if getattr(server, 'coroutines', False):
+				self.requestFinished()
+			raise
 
 	def buildResponse(self, method, postData):
 		self.handler = None
 		self.method = method
-		writer = ResponseWriter()
-
-		try: # raise DoneRendering; starts here to catch self.error calls
-			path = self.path
-			query = {}
-			queryStr = None
-
-			# Add GET params to query
-			if '?' in path:
-				path, queryStr = path.split('?', 1)
-				if queryStr != '':
-					query = self.parseQueryString(queryStr)
-
-			# Check GET params for a p_ prefix collision
-			for key in query:
-				if key[:2] == 'p_':
-					self.error("Invalid request", "Illegal query key: %s" % key)
-
-			# Add POST params to query with a p_ prefix
-			query.update(dict([('p_' + k, v) for (k, v) in postData.iteritems()]))
-
-			assert path[0] == '/'
-			path = path[1:]
-			if len(path) and path[-1] == '/': path = path[:-1]
-			path = unquote(path)
-			specAction = query.get('action', query.get('p_action', None))
-			for (pattern, action), handler in handlers[method].iteritems():
-				match = pattern.match(path)
-				if match:
-					if action is not None:
-						if action == specAction:
-							if 'action' in query:
-								del query['action']
-							else:
-								del query['p_action']
-						else: # Wrong action specifier (or none provided; taking a SFINAE approach and assuming another matching route won't need it)
-							continue
-					self.handler = handler
-					for k, v in match.groupdict().items():
-						if k in query:
-							self.error("Invalid request", "Duplicate key in request: %s" % k)
-						query[k] = v
-					break
-
-			query = self.preprocessQuery(query)
-
-			if self.handler is None:
-				self.error("Invalid request", "Unknown %s action <b>%s%s</b>" % (method.upper(), path or '/', " [%s]" % specAction if specAction else ''))
-
-			given = query.keys()
-			expected, _, _, defaults = getargspec(self.handler['fn'])
-			defaults = defaults or []
-
-			givenS, expectedS = set(given), set(expected)
-			requiredS = set(expected[:-len(defaults)] if defaults else expected)
-
-			expectedS -= set(['self', 'handler'])
-			requiredS -= set(['self', 'handler'])
-
-			over = givenS - expectedS
-			if len(over):
-				self.error("Invalid request", "Unexpected request argument%s: %s" % ('s' if len(over) > 1 else '', ', '.join(over)))
-
-			under = requiredS - givenS
-			if len(under):
-				self.error("Invalid request", "Missing expected request argument%s: %s" % ('s' if len(under) > 1 else '', ', '.join(under)))
-
-			self.path = '/' + path
-			self.replace('{{path}}', path)
-			self.replace('{{get-args}}', queryStr or '')
-
-			self.invokeHandler(self.handler, query)
+		self.coroutine = self.pending = None
+		self.writer = ResponseWriter()
+		self.rendering(self.dispatch, method, postData)
+		if self.coroutine is None:
+			self.finishResponse()
+
+	# Runs fn under the response's error handling; raise DoneRendering (e.g. via self.error) to end the response early.
+	# Anything that ends the response also abandons a suspended generator handler
+	def rendering(self, fn, *args):
+		try:
+			fn(*args)
+			return
 		except DoneRendering: pass
 		except StasisError, e:
-			writer.clear()
+			self.discardSession()
+			self.writer.clear()
 			self.title('Database Error')
 			self.error('Database Error', e.message, False)
-		except Redirect: raise
+		except Redirect:
+			self.coroutine = None
+			self.writer.done()
+			raise
 		except:
-			writer.start()
+			self.discardSession()
+			self.writer.start()
 			self.unhandledError()
+		self.coroutine = None
 
-		self.response = writer.done()
+	def dispatch(self, method, postData):
+		path = self.path
+		query = {}
+		queryStr = None
+
+		# Add GET params to query
+		if '?' in path:
+			path, queryStr = path.split('?', 1)
+			if queryStr != '':
+				query = self.parseQueryString(queryStr)
+
+		# Check GET params for a p_ prefix collision
+		for key in query:
+			if key[:2] == 'p_':
+				self.error("Invalid request", "Illegal query key: %s" % key)
+
+		# Add POST params to query with a p_ prefix
+		query.update(dict([('p_' + k, v) for (k, v) in postData.iteritems()]))
+
+		assert path[0] == '/'
+		path = path[1:]
+		if len(path) and path[-1] == '/': path = path[:-1]
+		path = unquote(path)
+		specAction = query.get('action', query.get('p_action', None))
+		for (pattern, action), handler in handlers[method].iteritems():
+			match = pattern.match(path)
+			if match:
+				if action is not None:
+					if action == specAction:
+						if 'action' in query:
+							del query['action']
+						else:
+							del query['p_action']
+					else: # Wrong action specifier (or none provided; taking a SFINAE approach and assuming another matching route won't need it)
+						continue
+				self.handler = handler
+				self.route = pattern.pattern[1:-1]
+				for k, v in match.groupdict().items():
+					if k in query:
+						self.error("Invalid request", "Duplicate key in request: %s" % k)
+					query[k] = v
+				break
+
+		query = self.preprocessQuery(query)
+
+		if self.handler is None:
+			self.error("Invalid request", "Unknown %s action <b>%s%s</b>" % (method.upper(), path or '/', " [%s]" % specAction if specAction else ''))
+
+		given = query.keys()
+		expected, _, _, defaults = lazyImport('inspect', 'getargspec')(self.handler['fn'])
+		defaults = defaults or []
+
+		givenS, expectedS = set(given), set(expected)
+		requiredS = set(expected[:-len(defaults)] if defaults else expected)
+
+		expectedS -= set(['self', 'handler'])
+		requiredS -= set(['self', 'handler'])
+
+		over = givenS - expectedS
+		if len(over):
+			self.error("Invalid request", "Unexpected request argument%s: %s" % ('s' if len(over) > 1 else '', ', '.join(over)))
+
+		under = requiredS - givenS
+		if len(under):
+			self.error("Invalid request", "Missing expected request argument%s: %s" % ('s' if len(under) > 1 else '', ', '.join(under)))
+
+		self.path = '/' + path
+		self.replace('{{path}}', path)
+		self.replace('{{get-args}}', queryStr or '')
+
+		self.invokeHandler(self.handler, query)
+		if self.coroutine is not None and not getattr(self.server, 'coroutines', False):
+			self.runCoroutine()
+
+	def finishResponse(self):
+		self.mark('render')
+		self.response = self.writer.done()
 		self.requestDone()
+		self.commitSession()
 		# self.leftMenu.clear()
 
 		for (fromStr, toStr, count) in self.replacements.values():
 			self.response = self.response.replace(fromStr, toStr, count)
 
+	# Generator handlers yield futures (anything with a blocking result() method) and are sent each one's result.
+	# Servers with an event loop (coroutines = True) call resume() as futures complete; other servers block in runCoroutine()
+	def stepCoroutine(self, value = None, excInfo = None):
+		try:
+			self.pending = self.coroutine.throw(*excInfo) if excInfo else self.coroutine.send(value)
+		except StopIteration:
+			self.coroutine = self.pending = None
+
+	def runCoroutine(self):
+		value = excInfo = None
+		while True:
+			self.stepCoroutine(value, excInfo)
+			if self.coroutine is None:
+				return
+			value = excInfo = None
+			try:
+				if self.pending is not None:
+					value = self.pending.result()
+			except:
+				excInfo = sys.exc_info()
+
+	def resume(self, value = None, excInfo = None):
+		resuming.add(self.context)
+		try:
+			self.rendering(self.stepCoroutine, value, excInfo)
+		except Redirect as r:
+			self.redirectedTo = r
+		finally:
+			resuming.discard(self.context)
+
+	# Renders and sends the response once resume() has run the generator to the end. This is where the page is
+	# post-processed and the session saved, so event-loop servers call it on a worker thread rather than the loop's
+	def completeCoroutine(self):
+		try:
+			if self.redirectedTo is not None:
+				raise self.redirectedTo
+			self.finishResponse()
+			self.sendHead(body = self.response if self.command != 'HEAD' else '')
+		except Redirect as r:
+			self.redirected(r)
+
 	def parseQueryString(self, query):
 		# Adapted from urlparse.parse_qsl
 		items = []
@@ -198,51 +371,180 @@ class HTTPHandler(BaseHTTPRequestHandler, object):
 	def replace(self, fromStr, toStr, count = -1):
 		self.replacements[fromStr] = (fromStr, toStr, count)
 
-	def sendHead(self, additionalHeaders = {}, includeCookie = True):
-		headers = {
-			'Content-type': self.contentType,
-			'Content-Length': str(len(self.response)),
-			'Last-Modified': self.date_time_string(),
-		}
-		if self.session:
-			headers['Set-Cookie'] = 'session=%s; expires=%s; path=/' % (self.session.key, timestamp())
+	def sendHead(self, additionalHeaders = {}, includeCookie = True, body = ''):
+		# Rendered pages can be unicode (bleach returns it, for one); they're sent as UTF-8
+		if isinstance(self.response, unicode):
+			self.response = self.response.encode('utf-8')
+		if isinstance(body, unicode):
+			body = body.encode('utf-8')
+		headers = [
+			('Content-type', self.contentType),
+			('Content-Length', len(self.response)),
+			('Last-Modified', httpDate()),
+		]
+		if includeCookie and self.session:
+			headers.append(('Set-Cookie', 'session=%s; expires=%s; path=/' % (self.session.key, timestamp())))
 		if self.forceDownload:
-			headers['Content-disposition'] = "attachment; filename=%s" % self.forceDownload
-
-		headers.update(additionalHeaders)
+			headers.append(('Content-disposition', "attachment; filename=%s" % self.forceDownload))
+		headers += additionalHeaders.items()
+		self.writeResponse(self.responseCode, headers, body)
+
+	# The status line, headers and body go out in one write, which is a single send() on the socket
+	def writeResponse(self, code, headers, body = ''):
+		self.status = code
+		self.log_request(code)
+		if self.request_version == 'HTTP/0.9':
+			data = body
+		else:
+			data = ''.join([self.statusLine(code), 'Date: ', httpDate(), '\r\n'] + ["%s: %s\r\n" % header for header in headers] + ['\r\n', body])
+		self.wfile.write(data.encode('utf-8') if isinstance(data, unicode) else data)
+		if getattr(self.server, 'tcpCork', False):
+			self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, 0)
+
+	def statusLine(self, code):
+		key = (type(self), code)
+		line = statusLines.get(key)
+		if line is None:
+			message = self.responses[code][0] if code in self.responses else ''
+			line = statusLines[key] = "%s %d %s\r\nServer: %s\r\n" % (self.protocol_version, code, message, self.version_string())
+		return line
+
+	def setup(self):
+		BaseHTTPRequestHandler.setup(self)
+		self.limits = getattr(self.server, 'limits', None)
+		if self.limits is not None:
+			self.rfile = RequestReader(self.rfile, self.connection, self.limits)
+
+	def parse_request(self):
+		if self.limits is not None:
+			self.rfile.startHeaders()
+		if not BaseHTTPRequestHandler.parse_request(self):
+			return False
+		if self.limits is not None:
+			try:
+				length = int(self.headers.getheader('Content-Length') or 0)
+			except ValueError:
+				length = 0
+			self.rfile.startBody(length)
+		return self.admit()
+
+	# Checks the server's per-session and per-route limits before the request is routed or its session loaded
+	def admit(self):
+		admission = getattr(self.server, 'admission', None)
+		if admission is None:
+			return True
+		wait = admission.checkRequest(self.client_address[0], self.path, Session.cookieKey(self))
+		if wait:
+			self.sendEmpty(429, 'Too Many Requests', {'Retry-After': retryAfter(wait)})
+			return False
+		return True
+
+	# Keeps the status for the access log
+	def send_response(self, code, message = None):
+		self.status = code
+		BaseHTTPRequestHandler.send_response(self, code, message)
+
+	# Requests go to the server's access log instead of stderr if it has one
+	def log_request(self, code = '-', size = '-'):
+		if getattr(self.server, 'accessLog', None) is None:
+			BaseHTTPRequestHandler.log_request(self, code, size)
+
+	# Records how long the request spent in each phase, in milliseconds
+	def mark(self, phase):
+		now = time.time()
+		self.timings[phase] = round((now - self.lastMark) * 1000, 3)
+		self.lastMark = now
+
+	# The request line can hold any bytes, so they're decoded before they reach the (JSON) access log
+	def accessEntry(self):
+		return {
+			'time': self.started,
+			'client': self.client_address[0],
+			'method': self.command.decode('utf-8', 'replace'),
+			'path': self.path.split('?', 1)[0].decode('utf-8', 'replace'),
+			'route': self.route,
+			'status': self.status,
+			'bytes': len(getattr(self, 'response', '') or '') if self.command != 'HEAD' else 0,
+			'timings': self.timings,
+			'session': md5(self.session.key)[:12] if self.session else None,
+		}
 
-		self.send_response(self.responseCode)
-		for name, value in headers.iteritems():
+	# A bodiless response that closes the connection; used to turn clients away without rendering anything
+	def sendEmpty(self, code, message, additionalHeaders = {}):
+		self.send_response(code, message)
+		for name, value in additionalHeaders.iteritems():
 			self.send_header(name, value)
+		self.send_header('Content-Length', '0')
+		self.send_header('Connection', 'close')
 		self.end_headers()
+		self.close_connection = 1
 
 	def handle_one_request(self):
+		if self.limits is not None and self.rfile.phase != 'request line':
+			self.rfile.startRequest()
 		try:
 			BaseHTTPRequestHandler.handle_one_request(self)
+		except RequestLimitExceeded as e:
+			self.limits.record(e)
+			self.log_error("%s while reading %s", e.message, self.rfile.phase)
+			self.sendEmpty(e.code, e.message)
 		except:
-			self.response = str(FrameworkException(sys.exc_info()))
-			self.sendHead(includeCookie = False)
-			self.wfile.write(self.response)
+			self.response = str(lazyImport('FrameworkException', 'FrameworkException')(sys.exc_info()))
+			self.sendHead(includeCookie = False, body = self.response)
 			raise
+		finally:
+			# Event-loop servers send the response later, and call requestFinished() themselves once it's gone
+			if not getattr(self.server, 'coroutines', False):
+				if self.streaming:
+					self.server.stream(self.connection, '', *self.streaming)
+				self.requestFinished()
+
+	def requestFinished(self):
+		if self.generation is not None:
+			leaveGeneration(self.generation, self.context)
+			self.generation = None
+		self.mark('send')
+		accessLog = getattr(self.server, 'accessLog', None)
+		if accessLog is not None and self.command:
+			accessLog.record(self.accessEntry())
+		self.runAfter()
+
+	# Queues fn to run on a background queue once the response has been sent
+	def after(self, fn, *args, **kw):
+		self.afterResponse.append(('default', fn, args, kw))
+
+	def runAfter(self):
+		releaseDeferred(self.context, self.afterResponse)
 
 	def do_HEAD(self, method = 'get', postData = {}):
-		self.session = Session.load(Session.determineKey(self))
+		if self.limits is not None:
+			self.rfile.finish()
+		self.mark('read')
+		self.session = SessionView(Session.load(Session.determineKey(self)), self.sessionConflicts)
+		self.mark('session')
 		self.processingRequest()
 
 		try:
 			self.buildResponse(method, postData)
-			self.sendHead()
+			if self.responding():
+				self.sendHead(body = self.response if self.command != 'HEAD' else '')
 		except Redirect as r:
+			self.redirected(r)
+
+	def redirected(self, r):
+		self.mark('render')
+		self.response = ''
+		if self.commitSession():
 			self.responseCode = 302
-			self.response = ''
 			self.sendHead(additionalHeaders = {'Location': r.target})
+		else:
+			self.sendHead(body = self.response if self.command != 'HEAD' else '')
 
 	def do_GET(self):
 		self.do_HEAD('get')
-		self.wfile.write(self.response)
 
 	def do_POST(self):
-		form = cgi.FieldStorage(fp = self.rfile, headers = self.headers, environ = {'REQUEST_METHOD': 'POST'}, keep_blank_values = True)
+		form = lazyImport('cgi', 'FieldStorage')(fp = self.rfile, headers = self.headers, environ = {'REQUEST_METHOD': 'POST'}, keep_blank_values = True)
 		data = {}
 		try:
 			items = []
@@ -255,7 +557,6 @@ class HTTPHandler(BaseHTTPRequestHandler, object):
 		except DoneRendering: pass
 		except TypeError: pass # Happens with empty forms
 		self.do_HEAD('post', data)
-		self.wfile.write(self.response)
 
 	def error(self, title, text, isDone = True):
 		print ErrorBox(title, text)
@@ -269,11 +570,61 @@ class HTTPHandler(BaseHTTPRequestHandler, object):
 	def preprocessQuery(self, query): return query
 
 	def invokeHandler(self, handler, query):
-		handler['fn'](handler = self, **query)
+		result = handler['fn'](handler = self, **query)
+		if 'stream' in handler:
+			self.startStream(handler['stream'], result)
+		elif isinstance(result, GeneratorType):
+			self.coroutine = result
+
+	def startStream(self, channels, events):
+		self.channels.update(channels)
+		initial = ''.join(str(event if isinstance(event, Event) else Event(event)) for event in events or ())
+		try:
+			lastEventID = int(self.headers.getheader('Last-Event-ID'))
+		except (TypeError, ValueError):
+			lastEventID = None
+
+		if not self.commitSession():
+			print self.response
+			done()
+		headers = [('Content-type', 'text/event-stream'), ('Cache-Control', 'no-cache')]
+		if self.session:
+			headers.append(('Set-Cookie', 'session=%s; expires=%s; path=/' % (self.session.key, timestamp())))
+		self.writeResponse(200, headers, initial)
+		self.streaming = (self.channels, lastEventID)
+		self.close_connection = 1 # The socket belongs to the event hub now, even on a keep-alive connection
+
+	# Adds channels to an event stream's subscription; other routes have no stream, so it does nothing there
+	def subscribe(self, *channels):
+		self.channels.update(channels)
+
+	# False while a generator handler is suspended, or once an event stream has sent its own response
+	def responding(self):
+		return self.coroutine is None and self.streaming is None
 
 	def requestDone(self): pass
 
+	# Session writes made during the request are saved together before its response goes out. If they conflict with
+	# another request's (and sessionConflicts is 'error'), none are saved and the response becomes a 409 page instead
+	def commitSession(self):
+		if self.session is not None:
+			try:
+				self.session.commit()
+			except SessionConflict, e:
+				self.session.discard()
+				self.responseCode = 409
+				self.title('Conflict')
+				self.response = str(ErrorBox('Conflict', "%s; please try again" % stripTags(str(e))))
+				return False
+		return True
+
+	# A request that fails with an error page leaves its session as it found it
+	def discardSession(self):
+		if self.session is not None:
+			self.session.discard()
+
 	def unhandledError(self):
+		showCode = lazyImport('code', 'showCode')
 		self.title('Unhandled Error')
 		print Box('Unhandled Error', formatException(), clr = 'red')
 		filename, line, fn, stmt = traceback.extract_tb(sys.exc_info()[2])[-1]
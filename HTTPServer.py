@@ -1,11 +1,40 @@
 from BaseHTTPServer import HTTPServer as ParentServer
 from datetime import datetime
+import socket
 from threading import Thread
 
+import Background
+import Session
+from EventStream import getHub
+from RateLimit import tooManyRequests
+from RequestLimits import RequestLimits
+
 requests = 0
 
 # This is basically SocketServer.ThreadingMixIn, but it also handles naming the threads
 class HTTPServer(ParentServer, object):
+	admission = None # Set to a RateLimit.AdmissionController to limit request rates
+	drainTimeout = 10 # Seconds server_close() waits for deferred background tasks to finish
+	accessLog = None # Set to an AccessLog.AccessLog to log requests there instead of stderr
+	preloadSessions = False # Unpickle the session file on a background thread at start-up instead of on first use
+	tcpNoDelay = True # Responses are written in one piece, so there's nothing to gain from Nagle's algorithm delaying them
+	tcpCork = False # Linux only; holds partial packets until the handler uncorks the socket after writing its response
+
+	def __init__(self, *args, **kw):
+		self.limits = RequestLimits() # Replace to tune read timeouts and size limits, or set to None to disable them
+		self.detached = set() # Sockets handed to the event hub, which closes them itself
+		ParentServer.__init__(self, *args, **kw)
+		if self.preloadSessions:
+			Session.preload()
+
+	def get_request(self):
+		request, client_address = ParentServer.get_request(self)
+		if self.tcpNoDelay:
+			request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		if self.tcpCork:
+			request.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, 1)
+		return request, client_address
+
 	def process_request_thread(self, request, client_address):
 		try:
 			self.finish_request(request, client_address)
@@ -16,7 +45,37 @@ class HTTPServer(ParentServer, object):
 
 	def process_request(self, request, client_address):
 		host, port = client_address
+		if self.admission is not None:
+			wait = self.admission.checkAddress(host)
+			if wait:
+				self.reject_request(request, wait)
+				return
 		now = datetime.now()
 		t = Thread(name = "request <%s> @%s" % (host, now), target = self.process_request_thread, args = (request, client_address))
 		t.daemon = True
 		t.start()
+
+	def shutdown_request(self, request):
+		if request in self.detached:
+			self.detached.discard(request)
+			return
+		ParentServer.shutdown_request(self, request)
+
+	# Hands an event stream's socket to the event hub once its request thread is done with it
+	def stream(self, request, initial, channels, lastEventID):
+		self.detached.add(request)
+		getHub().add(request, initial, channels, lastEventID)
+
+	# Rejected clients get a canned 429 from the accept loop; no thread is started and nothing is read or routed
+	def reject_request(self, request, wait):
+		try:
+			request.sendall(tooManyRequests(wait))
+		except socket.error:
+			pass
+		self.shutdown_request(request)
+
+	def server_close(self):
+		ParentServer.server_close(self)
+		Background.drain(self.drainTimeout)
+		if self.accessLog is not None:
+			self.accessLog.close()
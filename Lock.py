@@ -1,7 +1,13 @@
+import fcntl
 import functools
+import mmap
+import os
+import re
+import struct
 import sys
+import tempfile
 from thread import get_ident
-from threading import _Semaphore as Semaphore, _RLock as RLock
+from threading import _Semaphore as Semaphore, _RLock as RLock, Lock as ThreadLock
 from uuid import uuid1 as uuid
 
 from utils import *
@@ -9,6 +15,7 @@ from utils import *
 locks = {}
 counters = {}
 recordOwnerStack = False
+sharedDirectory = None
 
 def synchronized(lockName):
 	def wrap(f):
@@ -74,14 +81,52 @@ class ReentLock(RLock):
 	def __enter__(self): return self.acquire()
 	def __exit__(self, *x): return self.release()
 
-# Starting the name with # makes it single instead of reentrant
+# Shares a lock or counter between processes on this host: it's held by at most one thread across all of them
+class SharedLock(object):
+	def __init__(self, name, local):
+		self.local = local
+		self.fd = openShared('lock', name)
+		self.depth = 0
+
+	def avail(self):
+		return self.local.avail()
+
+	def reentrant(self):
+		return self.local.reentrant()
+
+	@property
+	def owner(self):
+		return self.local.owner
+
+	@property
+	def tb(self):
+		return self.local.tb
+
+	# fcntl locks belong to the process, so threads are kept out by the local lock and only the outermost acquire takes the file lock
+	def acquire(self):
+		self.local.acquire()
+		self.depth += 1
+		if self.depth == 1:
+			fcntl.lockf(self.fd, fcntl.LOCK_EX)
+
+	def release(self):
+		self.depth -= 1
+		if self.depth == 0:
+			fcntl.lockf(self.fd, fcntl.LOCK_UN)
+		self.local.release()
+
+	def __enter__(self): return self.acquire()
+	def __exit__(self, *x): return self.release()
+
+# Starting the name with # makes it single instead of reentrant; following that with @ shares it between processes
 def getLock(name = None):
 	if not name:
 		name = str(uuid())
 		while name in locks:
 			name = str(uuid())
 	if not name in locks:
-		locks[name] = SingleLock() if name[0] == '#' else ReentLock()
+		local = SingleLock() if name[0] == '#' else ReentLock()
+		locks[name] = SharedLock(name, local) if isShared(name) else local
 	return locks[name]
 
 def lock(name):
@@ -94,6 +139,25 @@ def setStackRecording(flag):
 	global recordOwnerStack
 	recordOwnerStack = flag
 
+def isShared(name):
+	return name.lstrip('#')[:1] == '@'
+
+# Where shared locks and counters keep their files. Processes share them if they use the same directory;
+# the default is per application (by base path) under the system temp directory
+def setSharedDirectory(path):
+	global sharedDirectory
+	sharedDirectory = path
+
+def openShared(kind, name):
+	path = sharedDirectory or os.path.join(tempfile.gettempdir(), "rorn-%s" % md5(basePath())[:8])
+	if not os.path.isdir(path):
+		try:
+			os.makedirs(path, 0700)
+		except OSError:
+			if not os.path.isdir(path): raise
+	filename = "%s-%s-%s" % (kind, re.sub('[^\\w.-]', '_', name), md5(name)[:8])
+	return os.open(os.path.join(path, filename), os.O_RDWR | os.O_CREAT, 0600)
+
 class Counter:
 	def __init__(self, start = 0):
 		self.count = start
@@ -122,6 +186,52 @@ class Counter:
 	def any(self):
 		return self.count != 0
 
+# A Counter kept in a shared memory mapping so every process sees the same value. start only applies to whichever process creates it
+class SharedCounter(object):
+	def __init__(self, name, start = 0):
+		self.fd = openShared('counter', name)
+		self.lock = ThreadLock()
+		fcntl.lockf(self.fd, fcntl.LOCK_EX)
+		try:
+			if os.fstat(self.fd).st_size < 8:
+				os.ftruncate(self.fd, 8)
+				os.write(self.fd, struct.pack('q', start))
+			self.map = mmap.mmap(self.fd, 8)
+		finally:
+			fcntl.lockf(self.fd, fcntl.LOCK_UN)
+
+	@property
+	def count(self):
+		return struct.unpack_from('q', self.map)[0]
+
+	def add(self, n):
+		with self.lock:
+			fcntl.lockf(self.fd, fcntl.LOCK_EX)
+			try:
+				count = self.count + n
+				struct.pack_into('q', self.map, 0, count)
+				return count
+			finally:
+				fcntl.lockf(self.fd, fcntl.LOCK_UN)
+
+	def inc(self):
+		return self.add(1)
+
+	def dec(self):
+		return self.add(-1)
+
+	def __iadd__(self, n):
+		self.add(n)
+		return self
+
+	def __isub__(self, n):
+		self.add(-n)
+		return self
+
+	def any(self):
+		return self.count != 0
+
+# Counters named starting with @ are shared between processes
 def getCounter(name = None, start = 0, unique = False):
 	if name:
 		base = name
@@ -135,5 +245,5 @@ def getCounter(name = None, start = 0, unique = False):
 			name = str(uuid())
 
 	if not name in counters:
-		counters[name] = Counter(start)
+		counters[name] = SharedCounter(name, start) if isShared(name) else Counter(start)
 	return counters[name]
@@ -0,0 +1,85 @@
+from collections import OrderedDict
+from math import ceil
+import re
+import time
+
+from Lock import getLock, getCounter
+
+# Token bucket per key: each key may make `burst` requests at once, refilled at `rate` requests per second.
+# Buckets live in an LRU bounded to `maxClients`; buckets unused for `idleTimeout` seconds are evicted as well.
+class RateLimiter:
+	def __init__(self, rate, burst = None, maxClients = 10000, idleTimeout = 300):
+		self.rate = float(rate)
+		self.burst = float(burst or max(rate, 1))
+		self.maxClients = maxClients
+		self.idleTimeout = idleTimeout
+		self.buckets = OrderedDict() # key -> [tokens, last refill time]
+		self.lock = getLock()
+
+	# Returns 0 if the request is admitted, otherwise the number of seconds until it would be
+	def check(self, key):
+		now = time.time()
+		with self.lock:
+			bucket = self.buckets.pop(key, None)
+			if bucket is None:
+				bucket = [self.burst, now]
+			else:
+				bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+				bucket[1] = now
+			self.buckets[key] = bucket
+			self.evict(now)
+
+			if bucket[0] >= 1:
+				bucket[0] -= 1
+				return 0
+			return (1 - bucket[0]) / self.rate
+
+	# Internal; caller holds self.lock
+	def evict(self, now):
+		while self.buckets:
+			key, (tokens, last) = next(self.buckets.iteritems())
+			if len(self.buckets) <= self.maxClients and now - last < self.idleTimeout:
+				break
+			del self.buckets[key]
+
+	def __len__(self):
+		return len(self.buckets)
+
+# Decides whether a request is served. perAddress is checked by HTTPServer before a request thread is started;
+# perSession and perRoute are checked by HTTPHandler once the request line and headers are parsed, before routing or loading the session.
+# perRoute maps path regexes (matched like @get/@post indices, without the leading slash) to limiters keyed by client address.
+class AdmissionController:
+	def __init__(self, perAddress = None, perSession = None, perRoute = None):
+		self.perAddress = perAddress
+		self.perSession = perSession
+		self.perRoute = [(re.compile("^%s$" % index), limiter) for index, limiter in (perRoute or {}).iteritems()]
+		self.rejected = getCounter()
+
+	def checkAddress(self, host):
+		return self.reject(self.perAddress.check(host) if self.perAddress is not None else 0)
+
+	def checkRequest(self, host, path, sessionKey):
+		if self.perSession is not None and sessionKey:
+			wait = self.perSession.check(sessionKey)
+			if wait:
+				return self.reject(wait)
+
+		if self.perRoute:
+			path = path.split('?', 1)[0].strip('/')
+			for pattern, limiter in self.perRoute:
+				if pattern.match(path):
+					wait = limiter.check((host, pattern.pattern))
+					if wait:
+						return self.reject(wait)
+		return 0
+
+	def reject(self, wait):
+		if wait:
+			self.rejected.inc()
+		return wait
+
+def retryAfter(wait):
+	return str(int(ceil(wait)))
+
+def tooManyRequests(wait):
+	return "HTTP/1.0 429 Too Many Requests\r\nRetry-After: %s\r\nContent-Length: 0\r\nConnection: close\r\n\r\n" % retryAfter(wait)
@@ -0,0 +1,157 @@
+import socket
+import time
+
+from Lock import getCounter
+
+# Limits applied while reading a request, so slow or oversized clients can't hold a request thread.
+# Timeouts are total deadlines for each phase (not per-recv), measured from when the phase starts:
+#   requestLineTimeout  from accepting the connection until the request line is read
+#   headerTimeout       for the header block
+#   bodyTimeout         for the request body
+# Size limits are in bytes; None disables a limit.
+class RequestLimits:
+	def __init__(self, requestLineTimeout = 10, headerTimeout = 10, bodyTimeout = 60, maxHeaders = 100, maxHeaderLine = 8190, maxHeaderSize = 65536, maxRequestSize = None):
+		self.requestLineTimeout = requestLineTimeout
+		self.headerTimeout = headerTimeout
+		self.bodyTimeout = bodyTimeout
+		self.maxHeaders = maxHeaders
+		self.maxHeaderLine = maxHeaderLine
+		self.maxHeaderSize = maxHeaderSize
+		self.maxRequestSize = maxRequestSize
+		self.rejected = {
+			RequestTimeout.code: getCounter(),
+			RequestTooLarge.code: getCounter(),
+			HeadersTooLarge.code: getCounter(),
+		}
+
+	def record(self, exc):
+		self.rejected[exc.code].inc()
+
+	def metrics(self):
+		return {exc.message: self.rejected[exc.code].count for exc in (RequestTimeout, RequestTooLarge, HeadersTooLarge)}
+
+class RequestLimitExceeded(Exception):
+	code = None
+	message = None
+
+class RequestTimeout(RequestLimitExceeded):
+	code = 408
+	message = 'Request Timeout'
+
+class RequestTooLarge(RequestLimitExceeded):
+	code = 413
+	message = 'Request Entity Too Large'
+
+class HeadersTooLarge(RequestLimitExceeded):
+	code = 431
+	message = 'Request Header Fields Too Large'
+
+# Stands in for a handler's rfile. It reads the connection itself, one recv() at a time, so each recv can be given only
+# what's left of the current phase's deadline; the size limits are checked on everything it returns
+class RequestReader:
+	def __init__(self, fp, connection, limits):
+		self.fp = fp
+		self.connection = connection
+		self.limits = limits
+		self.buffer = ''
+		self.startRequest()
+
+	# Keep-alive connections read several requests, each with its own deadlines and size limits
+	def startRequest(self):
+		self.size = 0
+		self.headerCount = self.headerSize = 0
+		self.phase = 'request line'
+		self.startPhase(self.limits.requestLineTimeout)
+
+	def startPhase(self, timeout):
+		self.deadline = None if timeout is None else time.time() + timeout
+
+	def startHeaders(self):
+		self.phase = 'headers'
+		self.startPhase(self.limits.headerTimeout)
+
+	def startBody(self, length):
+		self.phase = 'body'
+		if self.limits.maxRequestSize is not None and self.size + length > self.limits.maxRequestSize:
+			raise RequestTooLarge()
+		self.startPhase(self.limits.bodyTimeout)
+
+	# Called once the request has been read; responses are written without a deadline
+	def finish(self):
+		self.phase = 'done'
+		self.deadline = None
+		self.connection.settimeout(None)
+
+	def recv(self, size):
+		if self.deadline is None:
+			self.connection.settimeout(None)
+		else:
+			remaining = self.deadline - time.time()
+			if remaining <= 0:
+				raise RequestTimeout()
+			self.connection.settimeout(remaining)
+		try:
+			return self.connection.recv(size)
+		except socket.timeout:
+			raise RequestTimeout()
+
+	def count(self, data):
+		self.size += len(data)
+		if self.limits.maxRequestSize is not None and self.phase == 'body' and self.size > self.limits.maxRequestSize:
+			raise RequestTooLarge()
+		return data
+
+	def readline(self, size = -1):
+		if self.phase == 'headers' and self.limits.maxHeaderLine is not None:
+			size = self.limits.maxHeaderLine + 1 if size < 0 else min(size, self.limits.maxHeaderLine + 1)
+		if size == 0:
+			return ''
+
+		while True:
+			end = self.buffer.find('\n') + 1
+			if size > 0 and (not end or end > size) and len(self.buffer) >= size:
+				end = size
+			if end:
+				break
+			data = self.recv(8192)
+			if not data:
+				end = len(self.buffer)
+				break
+			self.buffer += data
+		line, self.buffer = self.buffer[:end], self.buffer[end:]
+
+		if self.phase == 'headers':
+			self.headerCount += 1
+			self.headerSize += len(line)
+			limits = self.limits
+			if (limits.maxHeaderLine is not None and len(line) > limits.maxHeaderLine) or (limits.maxHeaderSize is not None and self.headerSize > limits.maxHeaderSize) or (limits.maxHeaders is not None and self.headerCount > limits.maxHeaders + 1): # +1 for the blank line ending the block
+				raise HeadersTooLarge()
+		return self.count(line)
+
+	def read(self, size = -1):
+		chunks, have = [self.buffer], len(self.buffer)
+		while size < 0 or have < size:
+			data = self.recv(65536 if size < 0 else min(size - have, 65536))
+			if not data:
+				break
+			chunks.append(data)
+			have += len(data)
+		data = ''.join(chunks)
+		if size < 0:
+			self.buffer = ''
+		else:
+			data, self.buffer = data[:size], data[size:]
+		return self.count(data)
+
+	def readlines(self, sizehint = 0):
+		return list(iter(self.readline, ''))
+
+	def __iter__(self):
+		return iter(self.readline, '')
+
+	def close(self):
+		self.fp.close()
+
+	@property
+	def closed(self):
+		return self.fp.closed
@@ -1,17 +1,34 @@
 import sys
 from thread import get_ident
+from threading import local
 
 from Lock import synchronized
 
+# Output is captured per context: normally the current thread, but an event loop running several requests on one thread
+# sets a per-task context around each step so each request's prints go to its own writers
+context = local()
+
+def contextIdent():
+	return getattr(context, 'task', None) or get_ident()
+
+def setContext(task):
+	context.task = task
+
 class ResponseWriterManager:
 	def __init__(self):
 		self.writers = {}
-		self.old = sys.stdout
-		sys.stdout = self
+		self.old = None
+
+	# stdout is only redirected once the first writer starts, so importing rorn has no side effects
+	def install(self):
+		if self.old is None:
+			self.old = sys.stdout
+			sys.stdout = self
 
 	@synchronized('response-writer-manager')
 	def add(self, writer):
-		ident = get_ident()
+		self.install()
+		ident = contextIdent()
 		if ident not in self.writers:
 			self.writers[ident] = []
 		if writer not in self.writers[ident]:
@@ -19,7 +36,7 @@ class ResponseWriterManager:
 
 	@synchronized('response-writer-manager')
 	def remove(self, writer):
-		ident = get_ident()
+		ident = contextIdent()
 		if writer in self.writers[ident]:
 			self.writers[ident].remove(writer)
 			if self.writers[ident] == []:
@@ -27,7 +44,7 @@ class ResponseWriterManager:
 
 	@synchronized('response-writer-manager')
 	def write(self, data):
-		ident = get_ident()
+		ident = contextIdent()
 		if ident in self.writers:
 			self.writers[ident][-1].write(data)
 		else:
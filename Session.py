@@ -6,16 +6,25 @@ import os
 from utils import md5, ucfirst
 from datetime import datetime, timedelta
 import pickle
+from threading import Thread
 
 from Lock import synchronized
 
 serializer = None
+deleted = object() # Marks keys a SessionView removed
+
+class SessionConflict(Exception):
+	def __init__(self, key, keys):
+		Exception.__init__(self, "Session %s was changed by another request: %s" % (key, ', '.join(map(str, keys))))
+		self.keys = keys
 
 class Session(object):
 	def __init__(self, key):
 		self.key = key
 		self.map = {}
 		self.persistent = set() # Only keys in this set are saved to disk
+		self.version = 0
+		self.changed = {} # key -> version that last changed it, to spot conflicting SessionView commits
 
 	@synchronized('session')
 	def keys(self):
@@ -32,11 +41,15 @@ class Session(object):
 	@synchronized('session')
 	def __setitem__(self, k, v):
 		self.map[k] = v
+		self.version += 1
+		self.changed[k] = self.version
 		serializer.save(self.key)
 
 	@synchronized('session')
 	def __delitem__(self, k):
 		del self.map[k]
+		self.version += 1
+		self.changed[k] = self.version
 		serializer.save(self.key)
 
 	@synchronized('session')
@@ -49,7 +62,32 @@ class Session(object):
 
 	@synchronized('session')
 	def __iter__(self):
-		return self.map.__iter__()
+		return iter(self.map.keys())
+
+	@synchronized('session')
+	def snapshot(self):
+		return dict(self.map), self.version
+
+	# Applies a SessionView's writes in one step with a single save; returns the new version
+	@synchronized('session')
+	def apply(self, changes, remembered, base, conflicts):
+		conflicting = [k for k in changes if self.changed.get(k, 0) > base]
+		if conflicting:
+			if conflicts == 'error':
+				raise SessionConflict(self.key, conflicting)
+			elif conflicts == 'keep':
+				changes = {k: v for (k, v) in changes.iteritems() if k not in conflicting}
+		self.persistent.update(remembered)
+		if changes:
+			self.version += 1
+			for k, v in changes.iteritems():
+				if v is deleted:
+					self.map.pop(k, None)
+				else:
+					self.map[k] = v
+				self.changed[k] = self.version
+			serializer.save(self.key)
+		return self.version
 
 	@synchronized('session')
 	def __getstate__(self):
@@ -60,15 +98,22 @@ class Session(object):
 		self.key = key
 		self.map = map
 		self.persistent = set(map.keys())
+		self.version = 0
+		self.changed = {}
 
 	@staticmethod
 	@synchronized('session')
 	def determineKey(handler):
+		return Session.cookieKey(handler) or Session.generateKey()
+
+	# The key the client sent, if any; doesn't load or generate anything
+	@staticmethod
+	def cookieKey(handler):
 		hdr = handler.headers.getheader('Cookie')
-		if not hdr: return Session.generateKey()
+		if not hdr: return None
 		c = SimpleCookie()
 		c.load(hdr)
-		return c['session'].value if c.has_key('session') else Session.generateKey()
+		return c['session'].value if c.has_key('session') else None
 
 	@staticmethod
 	@synchronized('session')
@@ -93,13 +138,89 @@ class Session(object):
 	def destroy(key):
 		serializer.destroy(key)
 
-class SessionSerializer:
+# A request's own copy of its session. Reads come from a snapshot taken when the request started, so they don't take
+# the 'session' lock; writes update the copy and are kept until commit() applies them all to the Session at once.
+# Writes made after that (e.g. by handler.after() tasks) are applied as they happen; discard() drops uncommitted ones.
+# conflicts decides what happens to keys another request changed after the snapshot: 'merge' (this request's writes
+# win), 'keep' (the other request's writes win) or 'error' (raise SessionConflict and apply nothing)
+class SessionView(object):
+	def __init__(self, session, conflicts = 'merge'):
+		self.session = session
+		self.key = session.key
+		self.conflicts = conflicts
+		self.map, self.base = session.snapshot()
+		self.changes = {}
+		self.remembered = set()
+		self.committed = False
+
+	def keys(self):
+		return self.map.keys()
+
+	def values(self):
+		return self.map.values()
+
+	def __getitem__(self, k):
+		return self.map.get(k)
+
+	def __setitem__(self, k, v):
+		self.map[k] = v
+		self.changes[k] = v
+		if self.committed:
+			self.commit()
+
+	def __delitem__(self, k):
+		del self.map[k]
+		self.changes[k] = deleted
+		if self.committed:
+			self.commit()
+
+	def remember(self, *keys):
+		self.remembered.update(keys)
+		if self.committed:
+			self.commit()
+
+	def __contains__(self, k):
+		return k in self.map
+
+	def __iter__(self):
+		return iter(self.map.keys())
+
+	def commit(self):
+		self.committed = True
+		if self.changes or self.remembered:
+			changes, remembered = self.changes, self.remembered
+			self.changes, self.remembered = {}, set()
+			self.base = self.session.apply(changes, remembered, self.base, self.conflicts)
+
+	def discard(self):
+		self.map, self.base = self.session.snapshot()
+		self.changes, self.remembered = {}, set()
+
+class SessionSerializer(object):
 	def __init__(self):
-		try:
-			with open('session', 'r') as f:
-				self.sessions = pickle.load(f)
-		except Exception:
-			self.sessions = {}
+		self._sessions = None
+
+	# The session file is unpickled on first use (or by preload()) rather than when the module is imported
+	@property
+	def sessions(self):
+		return self._sessions if self._sessions is not None else self.loadAll()
+
+	# Unpickling calls Session.__setstate__, which takes the 'session' lock, so loading must hold it first
+	@synchronized('session')
+	def loadAll(self):
+		if self._sessions is None:
+			try:
+				with open('session', 'r') as f:
+					self._sessions = pickle.load(f)
+			except Exception:
+				self._sessions = {}
+		return self._sessions
+
+	def preload(self):
+		t = Thread(name = 'session preload', target = self.loadAll)
+		t.daemon = True
+		t.start()
+		return t
 
 	def get(self, sessionID):
 		if sessionID not in self.sessions:
@@ -128,13 +249,25 @@ def setSerializer(store):
 
 setSerializer(SessionSerializer()) # Default
 
+# Starts loading stored sessions in the background, if the serializer supports it
+def preload():
+	if hasattr(serializer, 'preload'):
+		return serializer.preload()
+
+# Cookie expiry dates; like utils.httpDate(), only reformatted when the second changes
+lastTimestamp = (None, None)
 def timestamp(days = 7):
-	return (datetime.utcnow() + timedelta(days)).strftime("%a, %d-%b-%Y %H:%M:%S GMT")
+	global lastTimestamp
+	key = (int(time.time()), days)
+	cached, formatted = lastTimestamp
+	if cached != key:
+		formatted = (datetime.utcfromtimestamp(key[0]) + timedelta(days)).strftime("%a, %d-%b-%Y %H:%M:%S GMT")
+		lastTimestamp = (key, formatted)
+	return formatted
 
+# Reassigned rather than appended to, so the change is committed with the rest of the request's session writes
 def delay(handler, item):
-	if 'delayed' not in handler.session:
-		handler.session['delayed'] = []
-	handler.session['delayed'].append(item)
+	handler.session['delayed'] = (handler.session['delayed'] or []) + [item]
 
 def undelay(handler):
 	if 'delayed' in handler.session:
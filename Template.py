@@ -0,0 +1,83 @@
+import re
+
+# Minimal compiled templates for small HTML fragments:
+#   {{name}}                  value, HTML-escaped at render time
+#   {{{name}}}                value, inserted as-is (already-rendered markup)
+#   {{#name}}...{{/name}}     rendered only if name is truthy
+#   {{^name}}...{{/name}}     rendered only if name is falsy
+# Templates are parsed once and cached by source, so rendering is a single pass and a join.
+# Variables must be passed to render(); sections treat a missing name as false.
+# Note that {{path}} and {{get-args}} are also HTTPHandler replacement markers; pass them in as values if a fragment needs them.
+
+tokenPattern = re.compile(r'\{\{\{\s*([\w-]+)\s*\}\}\}|\{\{([#^/]?)\s*([\w-]+)\s*\}\}')
+
+TEXT, VAR, RAW, SECTION, INVERTED = range(5)
+
+def escape(value):
+	return ('%s' % value).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;').replace("'", '&#39;')
+
+class TemplateError(Exception): pass
+
+class Template:
+	def __init__(self, source):
+		self.source = source
+		self.nodes = self.parse(source)
+
+	def parse(self, source):
+		root = []
+		stack = [(None, root)]
+		pos = 0
+		for match in tokenPattern.finditer(source):
+			nodes = stack[-1][1]
+			if match.start() > pos:
+				nodes.append((TEXT, source[pos:match.start()], None))
+			pos = match.end()
+
+			raw, sigil, name = match.groups()
+			if raw:
+				nodes.append((RAW, raw, None))
+			elif sigil == '':
+				nodes.append((VAR, name, None))
+			elif sigil == '/':
+				if stack[-1][0] != name:
+					raise TemplateError("Unexpected {{/%s}} at offset %d" % (name, match.start()))
+				stack.pop()
+			else:
+				children = []
+				nodes.append((SECTION if sigil == '#' else INVERTED, name, children))
+				stack.append((name, children))
+
+		if len(stack) > 1:
+			raise TemplateError("Unclosed section {{#%s}}" % stack[-1][0])
+		if pos < len(source):
+			root.append((TEXT, source[pos:], None))
+		return root
+
+	def render(self, **values):
+		out = []
+		self.renderNodes(self.nodes, values, out)
+		return ''.join(out)
+
+	def renderNodes(self, nodes, values, out):
+		for kind, value, children in nodes:
+			if kind == TEXT:
+				out.append(value)
+			elif kind == VAR:
+				out.append(escape(values[value]))
+			elif kind == RAW:
+				out.append('%s' % values[value])
+			elif bool(values.get(value)) == (kind == SECTION):
+				self.renderNodes(children, values, out)
+
+	def __call__(self, **values):
+		return self.render(**values)
+
+templates = {}
+
+def getTemplate(source):
+	if source not in templates:
+		templates[source] = Template(source)
+	return templates[source]
+
+def render(source, **values):
+	return getTemplate(source).render(**values)
@@ -0,0 +1,65 @@
+# Cost of process-shared locks and counters (names starting with @) against the in-process versions, plus a check that
+# forked processes incrementing one shared counter don't lose updates. Exits non-zero if the check fails.
+#
+#   python benchmarks/locks.py [--ops 100000] [--processes 4] [--increments 2000]
+from optparse import OptionParser
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+def timeOps(fn, ops):
+	start = time.time()
+	for i in xrange(ops):
+		fn()
+	return (time.time() - start) / ops * 1e6
+
+def lockCycle(lock):
+	def cycle():
+		lock.acquire()
+		lock.release()
+	return cycle
+
+def main():
+	parser = OptionParser()
+	parser.add_option('--ops', type = 'int', default = 100000)
+	parser.add_option('--processes', type = 'int', default = 4)
+	parser.add_option('--increments', type = 'int', default = 2000)
+	options, args = parser.parse_args()
+
+	from Lock import getCounter, getLock, setSharedDirectory
+	directory = tempfile.mkdtemp()
+	setSharedDirectory(directory)
+	try:
+		rows = [
+			('counter inc', getCounter('bench-counter').inc, getCounter('@bench-counter').inc),
+			('lock acquire/release', lockCycle(getLock('bench-lock')), lockCycle(getLock('@bench-lock'))),
+			('single lock acquire/release', lockCycle(getLock('#bench-single')), lockCycle(getLock('#@bench-single'))),
+		]
+		print "%-30s %12s %12s" % ('', 'in-process', 'shared')
+		for name, local, shared in rows:
+			print "%-30s %10.2fus %10.2fus" % (name, timeOps(local, options.ops), timeOps(shared, options.ops))
+
+		# Each child opens the counter itself, as separate server processes would
+		children = []
+		for i in range(options.processes):
+			pid = os.fork()
+			if pid == 0:
+				counter = getCounter('@bench-fork')
+				for j in xrange(options.increments):
+					counter.inc()
+				os._exit(0)
+			children.append(pid)
+		for pid in children:
+			os.waitpid(pid, 0)
+		total = getCounter('@bench-fork').count
+		expected = options.processes * options.increments
+		print "%d processes x %d increments: %d (expected %d)" % (options.processes, options.increments, total, expected)
+	finally:
+		shutil.rmtree(directory)
+	sys.exit(0 if total == expected else 1)
+
+if __name__ == '__main__':
+	sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+	main()
@@ -0,0 +1,84 @@
+# Import-time and first-session-access benchmark. Each run is a fresh interpreter, so nothing is already imported.
+# Fails if importing HTTPHandler pulls in the modules that are meant to load on first use, or if the median import
+# time goes over --max-import-ms.
+#
+#   python benchmarks/startup.py [--runs 20] [--sessions 1000] [--max-import-ms 500]
+from optparse import OptionParser
+import json
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+lazy = ['bleach', 'cgi', 'inspect', 'SilverCity', 'FrameworkException', 'code']
+
+child = r'''
+import json, sys, time
+sys.path.insert(0, %r)
+start = time.time()
+import HTTPHandler
+imported = time.time()
+import Session
+Session.serializer.sessions
+loaded = time.time()
+print json.dumps({
+	'import': (imported - start) * 1000,
+	'session': (loaded - imported) * 1000,
+	'loaded': [name for name in %r if name in sys.modules],
+	'stdout': sys.stdout is sys.__stdout__,
+})
+'''
+
+def median(values):
+	values = sorted(values)
+	return values[len(values) // 2]
+
+def main():
+	parser = OptionParser()
+	parser.add_option('--runs', type = 'int', default = 20)
+	parser.add_option('--sessions', type = 'int', default = 1000, help = 'sessions in the session file loaded on first access')
+	parser.add_option('--max-import-ms', type = 'float', default = None)
+	options, args = parser.parse_args()
+
+	import HTTPHandler # So the child's unpickling finds Session
+	from Session import Session
+	directory = tempfile.mkdtemp()
+	try:
+		sessions = {}
+		for i in range(options.sessions):
+			session = sessions['key%d' % i] = Session('key%d' % i)
+			session.map = {'user': 'user%d' % i, 'visits': i}
+			session.persistent = set(session.map)
+		with open(os.path.join(directory, 'session'), 'w') as f:
+			pickle.dump(sessions, f)
+
+		results = []
+		for i in range(options.runs):
+			output = subprocess.check_output([sys.executable, '-c', child % (root, lazy)], cwd = directory)
+			results.append(json.loads(output))
+	finally:
+		shutil.rmtree(directory)
+
+	importMs = median([r['import'] for r in results])
+	sessionMs = median([r['session'] for r in results])
+	print "import HTTPHandler:   %.1fms (median of %d)" % (importMs, options.runs)
+	print "first session access: %.1fms (%d sessions)" % (sessionMs, options.sessions)
+
+	failures = []
+	loaded = sorted(set(name for r in results for name in r['loaded']))
+	if loaded:
+		failures.append("imported at startup: %s" % ', '.join(loaded))
+	if not all(r['stdout'] for r in results):
+		failures.append("sys.stdout replaced at import time")
+	if options.max_import_ms is not None and importMs > options.max_import_ms:
+		failures.append("import took %.1fms, over the %.1fms budget" % (importMs, options.max_import_ms))
+	for failure in failures:
+		print "FAIL: %s" % failure
+	sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+	sys.path.insert(0, root)
+	main()
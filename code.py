@@ -1,5 +1,4 @@
 from __future__ import with_statement
-from bleach import clean
 from StringIO import StringIO
 import sys
 from os.path import abspath, isabs, isfile
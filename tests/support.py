@@ -0,0 +1,66 @@
+import os
+import socket
+import sys
+import tempfile
+from threading import Thread
+import unittest
+
+# The framework is imported as the rorn package, the way applications use it
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if os.path.basename(root) == 'rorn':
+	sys.path.insert(0, os.path.dirname(root))
+else:
+	packages = tempfile.mkdtemp()
+	os.symlink(root, os.path.join(packages, 'rorn'))
+	sys.path.insert(0, packages)
+
+# Runs each test in its own working directory, since sessions are saved there, and stops any servers it started
+class ServerTestCase(unittest.TestCase):
+	def setUp(self):
+		self.cwd = os.getcwd()
+		self.directory = tempfile.mkdtemp()
+		os.chdir(self.directory)
+		self.servers = []
+
+	def tearDown(self):
+		for server, thread in self.servers:
+			server.shutdown()
+			thread.join()
+			server.server_close()
+		os.chdir(self.cwd)
+
+	def serve(self, server):
+		thread = Thread(target = server.serve_forever)
+		thread.daemon = True
+		thread.start()
+		self.servers.append((server, thread))
+		return server
+
+	def connect(self, server):
+		sock = socket.create_connection(server.server_address)
+		sock.settimeout(10)
+		return sock
+
+	# Everything the server sends until it closes the connection
+	def receive(self, sock):
+		data = ''
+		while True:
+			try:
+				chunk = sock.recv(4096)
+			except socket.error:
+				break
+			if not chunk:
+				break
+			data += chunk
+		return data
+
+	def request(self, server, data):
+		sock = self.connect(server)
+		try:
+			sock.sendall(data)
+			return self.receive(sock)
+		finally:
+			sock.close()
+
+	def get(self, server, path, method = 'GET', headers = ''):
+		return self.request(server, '%s /%s HTTP/1.0\r\n%s\r\n' % (method, path, headers))
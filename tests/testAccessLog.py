@@ -0,0 +1,62 @@
+import json
+import os
+import time
+import unittest
+
+from support import ServerTestCase
+from rorn.AccessLog import AccessLog
+from rorn.HTTPServer import HTTPServer
+from rorn.HTTPHandler import HTTPHandler, get
+
+@get('access-log-test')
+def accessLogTest(handler):
+	print "logged"
+
+class AccessLogTest(ServerTestCase):
+	def entries(self, log):
+		log.close()
+		with open(log.filename) as f:
+			return [json.loads(line) for line in f]
+
+	def testRequests(self):
+		server = self.serve(HTTPServer(('127.0.0.1', 0), HTTPHandler))
+		log = server.accessLog = AccessLog('access.log', flushInterval = 0.05)
+		self.get(server, 'access-log-test')
+		self.get(server, '\xff')
+		self.get(server, 'access-log-test')
+		time.sleep(0.2)
+		self.assertTrue(log.writer.is_alive())
+		entries = self.entries(log)
+		self.assertEqual([entry['path'] for entry in entries], ['/access-log-test', u'/\ufffd', '/access-log-test'])
+		self.assertEqual(entries[0]['route'], 'access-log-test')
+		self.assertEqual(entries[0]['status'], 200)
+
+	# An entry that can't be serialized is dropped without stopping the writer
+	def testUnserializableEntry(self):
+		log = AccessLog('access.log', flushInterval = 0.05)
+		log.record({'path': '/\xff'})
+		time.sleep(0.2)
+		self.assertTrue(log.writer.is_alive())
+		log.record({'path': '/ok'})
+		self.assertEqual(self.entries(log), [{'path': '/ok'}])
+		self.assertEqual(log.metrics()['dropped'], 1)
+
+	def testSampling(self):
+		log = AccessLog('access.log', flushInterval = 0.05, sampling = {'never': 0, 'always': 1})
+		log.record({'route': 'never'})
+		log.record({'route': 'always'})
+		self.assertEqual(self.entries(log), [{'route': 'always', 'sample': 1}])
+		self.assertEqual(log.metrics()['sampledOut'], 1)
+
+	def testRotation(self):
+		log = AccessLog('access.log', maxBytes = 100, backupCount = 2, batchSize = 1, flushInterval = 0.01)
+		for i in range(10):
+			log.record({'n': i, 'padding': 'x' * 50})
+			time.sleep(0.03)
+		log.close()
+		self.assertTrue(os.path.exists('access.log.1'))
+		self.assertTrue(os.path.exists('access.log.2'))
+		self.assertFalse(os.path.exists('access.log.3'))
+
+if __name__ == '__main__':
+	unittest.main()
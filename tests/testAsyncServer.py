@@ -0,0 +1,104 @@
+from threading import Event, current_thread
+import unittest
+
+from support import ServerTestCase
+from rorn.AsyncServer import AsyncHTTPServer
+from rorn import HTTPHandler as handlerModule
+from rorn.HTTPHandler import HTTPHandler, get
+from rorn.utils import redirect
+
+# Only promises a blocking result(), like the futures of other libraries
+class PlainFuture:
+	def __init__(self, value):
+		self.value = value
+
+	def result(self):
+		return self.value
+
+@get('async-plain-future')
+def plainFuture(handler):
+	value = yield PlainFuture('plain')
+	print value
+
+@get('async-native-future')
+def nativeFuture(handler):
+	yield handler.server.sleep(0.01)
+	value = yield handler.server.executor.submit(lambda: 'native')
+	print value
+
+@get('async-not-a-future')
+def notAFuture(handler):
+	yield 42
+	print 'unreachable'
+
+afterRan = Event()
+
+@get('async-after')
+def withAfter(handler):
+	handler.after(afterRan.set)
+	print 'rendered'
+
+# Fails outside the handler's own error handling, so the exception leaves the handler's constructor
+class FailingHandler(HTTPHandler):
+	def requestDone(self):
+		raise ValueError('requestDone failed')
+
+@get('async-redirect')
+def asyncRedirect(handler):
+	yield handler.server.sleep(0.01)
+	redirect('/elsewhere')
+
+# Records the thread that finishes each response
+class RecordingHandler(HTTPHandler):
+	finishedOn = []
+
+	def requestDone(self):
+		self.finishedOn.append(current_thread().name)
+
+class AsyncServerTest(ServerTestCase):
+	def setUp(self):
+		ServerTestCase.setUp(self)
+		self.server = self.serve(AsyncHTTPServer(('127.0.0.1', 0), HTTPHandler, workers = 2))
+
+	def testNativeFuture(self):
+		response = self.get(self.server, 'async-native-future')
+		self.assertTrue(response.startswith('HTTP/1.0 200'), response)
+		self.assertTrue(response.endswith('native\n'), response)
+
+	def testPlainFuture(self):
+		response = self.get(self.server, 'async-plain-future')
+		self.assertTrue(response.startswith('HTTP/1.0 200'), response)
+		self.assertTrue(response.endswith('plain\n'), response)
+
+	# The handler gets the error, so the usual error page is sent
+	def testNotAFuture(self):
+		response = self.get(self.server, 'async-not-a-future')
+		self.assertTrue(response.startswith('HTTP/1.0 200'), response)
+		self.assertTrue('Unhandled Error' in response, response)
+		self.assertTrue('AttributeError' in response, response)
+		self.assertFalse('unreachable' in response, response)
+
+	def testRedirect(self):
+		response = self.get(self.server, 'async-redirect')
+		self.assertTrue(response.startswith('HTTP/1.0 302'), response)
+		self.assertTrue('\r\nLocation: /elsewhere\r\n' in response, response)
+
+	# Rendering the finished page and saving the session happen on a worker, not the loop thread
+	def testCompletedOnWorker(self):
+		server = self.serve(AsyncHTTPServer(('127.0.0.1', 0), RecordingHandler, workers = 2))
+		del RecordingHandler.finishedOn[:]
+		self.assertTrue(self.get(server, 'async-native-future').endswith('native\n'))
+		self.assertEqual(len(RecordingHandler.finishedOn), 1)
+		self.assertTrue(RecordingHandler.finishedOn[0].startswith('request worker'), RecordingHandler.finishedOn)
+
+	def testFailingHandler(self):
+		server = self.serve(AsyncHTTPServer(('127.0.0.1', 0), FailingHandler, workers = 2))
+		inflight = sum(handlerModule.inflight.values())
+		afterRan.clear()
+		response = self.get(server, 'async-after')
+		self.assertTrue('requestDone failed' in response, response)
+		self.assertTrue(afterRan.wait(2))
+		self.assertEqual(sum(handlerModule.inflight.values()), inflight)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,88 @@
+from threading import Event, Thread
+import time
+import unittest
+
+from support import ServerTestCase
+from rorn import Background
+from rorn.Executor import Executor, Cancelled
+from rorn.HTTPServer import HTTPServer
+from rorn.AsyncServer import AsyncHTTPServer
+from rorn.HTTPHandler import HTTPHandler, get
+
+responseReceived = Event()
+afterRan = Event()
+deferRan = Event()
+
+# Blocks until the test has the response, so the response must have been sent before after() tasks run
+def waitForResponse(event):
+	if responseReceived.wait(5):
+		event.set()
+
+@get('background-after')
+def backgroundAfter(handler):
+	handler.after(waitForResponse, afterRan)
+	Background.defer(waitForResponse, deferRan)
+	print 'sent'
+
+class BackgroundTest(ServerTestCase):
+	def setUp(self):
+		ServerTestCase.setUp(self)
+		for event in (responseReceived, afterRan, deferRan):
+			event.clear()
+
+	def checkAfterResponse(self, server):
+		start = time.time()
+		response = self.get(server, 'background-after')
+		self.assertTrue(time.time() - start < 2)
+		self.assertTrue(response.endswith('sent\n'), response)
+		self.assertFalse(afterRan.is_set() or deferRan.is_set())
+		responseReceived.set()
+		self.assertTrue(afterRan.wait(2))
+		self.assertTrue(deferRan.wait(2))
+
+	def testAfterResponse(self):
+		self.checkAfterResponse(self.serve(HTTPServer(('127.0.0.1', 0), HTTPHandler)))
+
+	def testAfterResponseOnEventLoop(self):
+		self.checkAfterResponse(self.serve(AsyncHTTPServer(('127.0.0.1', 0), HTTPHandler, workers = 2)))
+
+	# Outside a request there's no response to wait for
+	def testDeferOutsideRequest(self):
+		ran = Event()
+		Background.defer(ran.set)
+		self.assertTrue(ran.wait(2))
+
+	def testDrain(self):
+		release = Event()
+		Background.deferTo('drain-test', release.wait, 5)
+		self.assertFalse(Background.drain(0.1))
+		release.set()
+		self.assertTrue(Background.drain(2))
+		self.assertTrue('drain-test' in Background.queues) # Still usable by other servers
+
+	def testGetQueueOnce(self):
+		queues = []
+		threads = [Thread(target = lambda: queues.append(Background.getQueue('get-queue-test'))) for i in range(8)]
+		for t in threads:
+			t.start()
+		for t in threads:
+			t.join()
+		self.assertEqual(len(set(map(id, queues))), 1)
+
+	# A full queue doesn't block shutdown; what can't run is cancelled
+	def testShutdownFullQueue(self):
+		release = Event()
+		executor = Executor(1, 2, 'shutdown-test')
+		executor.submit(release.wait, 5)
+		time.sleep(0.1) # Let the worker take the first task
+		futures = [executor.submit(lambda: 'queued') for i in range(2)]
+		start = time.time()
+		executor.shutdown(False)
+		self.assertTrue(time.time() - start < 1)
+		release.set()
+		self.assertRaises(Cancelled, futures[0].result)
+		self.assertEqual(executor.metrics()['cancelled'], 1)
+		self.assertEqual(futures[1].result(), 'queued')
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,120 @@
+import socket
+import time
+import unittest
+
+from support import ServerTestCase
+from rorn.AsyncServer import AsyncHTTPServer
+from rorn.EventStream import EventHub, Event, getHub, setHub, publish
+from rorn.HTTPServer import HTTPServer
+from rorn.HTTPHandler import HTTPHandler, get, stream
+from rorn.RequestLimits import RequestLimits
+
+@stream('events-test', channels = 'events-test')
+def eventsTest(handler):
+	handler.subscribe('events-extra')
+	yield 'hello'
+	yield Event('named', event = 'greeting')
+
+@get('events-subscribe')
+def subscribeElsewhere(handler):
+	handler.subscribe('events-test')
+	print 'not a stream'
+
+class KeepAliveHandler(HTTPHandler):
+	protocol_version = 'HTTP/1.1'
+
+class EventStreamTest(ServerTestCase):
+	def setUp(self):
+		ServerTestCase.setUp(self)
+		self.hub = EventHub(heartbeat = 0.2)
+		setHub(self.hub)
+
+	def tearDown(self):
+		setHub(None)
+		ServerTestCase.tearDown(self)
+
+	def readUntil(self, sock, text, timeout = 3):
+		data = ''
+		deadline = time.time() + timeout
+		sock.settimeout(0.1)
+		while text not in data and time.time() < deadline:
+			try:
+				chunk = sock.recv(4096)
+			except socket.timeout:
+				continue
+			if not chunk:
+				break
+			data += chunk
+		self.assertTrue(text in data, data)
+		return data
+
+	def open(self, server, headers = ''):
+		sock = self.connect(server)
+		sock.sendall('GET /events-test HTTP/1.1\r\nHost: localhost\r\n%s\r\n' % headers)
+		return sock
+
+	def waitForSubscribers(self, count):
+		deadline = time.time() + 2
+		while self.hub.metrics()['subscribers'] != count and time.time() < deadline:
+			time.sleep(0.01)
+		self.assertEqual(self.hub.metrics()['subscribers'], count)
+
+	def checkStream(self, server):
+		sock = self.open(server)
+		head = self.readUntil(sock, 'event: greeting\ndata: named\n\n')
+		self.assertTrue(head.startswith('HTTP/1.0 200'), head)
+		self.assertTrue('\r\nContent-type: text/event-stream\r\n' in head, head)
+		self.assertTrue('data: hello\n\n' in head, head)
+		self.waitForSubscribers(1)
+
+		publish('events-test', 'first')
+		publish('events-extra', 'second')
+		self.readUntil(sock, 'data: second\n\n')
+		self.readUntil(sock, ':\n\n') # Heartbeat
+		sock.close()
+		self.waitForSubscribers(0)
+
+	def testThreadedServer(self):
+		self.checkStream(self.serve(HTTPServer(('127.0.0.1', 0), HTTPHandler)))
+
+	def testEventLoop(self):
+		self.checkStream(self.serve(AsyncHTTPServer(('127.0.0.1', 0), HTTPHandler, workers = 2)))
+
+	# The request thread mustn't keep reading a socket the hub owns (it would time out and write a 408 into the stream)
+	def testKeepAliveHandoff(self):
+		server = self.serve(HTTPServer(('127.0.0.1', 0), KeepAliveHandler))
+		server.limits = RequestLimits(requestLineTimeout = 0.5)
+		sock = self.open(server)
+		self.readUntil(sock, 'data: named\n\n')
+		time.sleep(1)
+		publish('events-test', 'still streaming')
+		data = self.readUntil(sock, 'data: still streaming\n\n')
+		self.assertFalse('408' in data, data)
+		sock.close()
+
+	def testLastEventID(self):
+		server = self.serve(HTTPServer(('127.0.0.1', 0), HTTPHandler))
+		sock = self.open(server)
+		self.readUntil(sock, 'data: named\n\n')
+		self.waitForSubscribers(1)
+		publish('events-test', 'seen')
+		data = self.readUntil(sock, 'data: seen\n\n')
+		seenID = int(data.split('data: seen')[0].rsplit('id: ', 1)[1].split('\n')[0])
+		sock.close()
+		self.waitForSubscribers(0)
+
+		publish('events-test', 'missed')
+		publish('events-other', 'not subscribed')
+		sock = self.open(server, 'Last-Event-ID: %d\r\n' % seenID)
+		data = self.readUntil(sock, 'data: missed\n\n')
+		self.assertFalse('data: seen\n' in data, data)
+		self.assertFalse('not subscribed' in data, data)
+		sock.close()
+
+	def testSubscribeOutsideStream(self):
+		response = self.get(self.serve(HTTPServer(('127.0.0.1', 0), HTTPHandler)), 'events-subscribe')
+		self.assertTrue(response.startswith('HTTP/1.0 200'), response)
+		self.assertTrue(response.endswith('not a stream\n'), response)
+
+if __name__ == '__main__':
+	unittest.main()
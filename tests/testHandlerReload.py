@@ -0,0 +1,47 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+from support import ServerTestCase
+from rorn.AsyncServer import AsyncHTTPServer
+from rorn.HTTPServer import HTTPServer
+from rorn.HTTPHandler import HTTPHandler, get, reloadHandlers
+
+directory = tempfile.mkdtemp()
+with open(os.path.join(directory, 'reloadTarget.py'), 'w') as f:
+	f.write("@get('reload-target')\ndef target(handler):\n\tprint 'target'\n")
+sys.path.insert(0, directory)
+import reloadTarget
+
+@get('reload-now')
+def reloadNow(handler):
+	start = time.time()
+	drained = reloadHandlers([reloadTarget], drainTimeout = 2)
+	print "reloaded %s %.2f" % (drained, time.time() - start)
+
+@get('reload-coroutine')
+def reloadCoroutine(handler, wait):
+	yield handler.server.sleep(0.01)
+	reloadHandlers([reloadTarget], drainTimeout = 2, wait = wait == 'yes')
+	print "reloaded"
+
+class HandlerReloadTest(ServerTestCase):
+	# The request calling reloadHandlers() is running on the old handlers, but mustn't wait for itself
+	def testReloadFromRequest(self):
+		server = self.serve(HTTPServer(('127.0.0.1', 0), HTTPHandler))
+		response = self.get(server, 'reload-now')
+		self.assertTrue(response.startswith('HTTP/1.0 200'), response)
+		drained, elapsed = response.rstrip().split(' ')[-2:]
+		self.assertEqual(drained, 'True')
+		self.assertTrue(float(elapsed) < 1, elapsed)
+		self.assertTrue(self.get(server, 'reload-target').endswith('target\n'))
+
+	def testReloadFromEventLoop(self):
+		server = self.serve(AsyncHTTPServer(('127.0.0.1', 0), HTTPHandler, workers = 2))
+		self.assertTrue(self.get(server, 'reload-coroutine?wait=no').endswith('reloaded\n'))
+		self.assertFalse('reloaded\n' in self.get(server, 'reload-coroutine?wait=yes'))
+
+if __name__ == '__main__':
+	unittest.main()
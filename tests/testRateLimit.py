@@ -0,0 +1,114 @@
+import unittest
+
+from support import ServerTestCase
+from rorn import RateLimit
+from rorn.RateLimit import RateLimiter, AdmissionController
+from rorn.AsyncServer import AsyncHTTPServer
+from rorn.HTTPServer import HTTPServer
+from rorn.HTTPHandler import HTTPHandler, get
+
+@get('rate-test')
+def rateTest(handler):
+	print "ok"
+
+@get('rate-other')
+def rateOther(handler):
+	print "ok"
+
+# Stands in for the time module so bucket refills don't depend on sleeping
+class Clock:
+	def __init__(self):
+		self.now = 1000.0
+
+	def time(self):
+		return self.now
+
+class RateLimiterTest(unittest.TestCase):
+	def setUp(self):
+		self.clock = Clock()
+		self.realTime, RateLimit.time = RateLimit.time, self.clock
+
+	def tearDown(self):
+		RateLimit.time = self.realTime
+
+	def testBurst(self):
+		limiter = RateLimiter(2, burst = 3)
+		self.assertEqual([limiter.check('a') for i in range(3)], [0, 0, 0])
+		self.assertAlmostEqual(limiter.check('a'), 0.5)
+		# Other keys have buckets of their own
+		self.assertEqual(limiter.check('b'), 0)
+
+	def testRefill(self):
+		limiter = RateLimiter(2, burst = 2)
+		limiter.check('a')
+		limiter.check('a')
+		self.assertTrue(limiter.check('a'))
+		self.clock.now += 0.5
+		self.assertEqual(limiter.check('a'), 0)
+		self.assertTrue(limiter.check('a'))
+
+		# Refilling stops at the burst size
+		self.clock.now += 60
+		self.assertEqual([limiter.check('a') for i in range(2)], [0, 0])
+		self.assertTrue(limiter.check('a'))
+
+	def testMaxClients(self):
+		limiter = RateLimiter(1, maxClients = 3)
+		for key in 'abcd':
+			limiter.check(key)
+		self.assertEqual(len(limiter), 3)
+		self.assertEqual(limiter.buckets.keys(), list('bcd'))
+
+		# Using a bucket makes it the most recent, so the oldest unused one goes next
+		limiter.check('b')
+		limiter.check('e')
+		self.assertEqual(limiter.buckets.keys(), list('dbe'))
+
+	def testIdleTimeout(self):
+		limiter = RateLimiter(1, idleTimeout = 10)
+		limiter.check('a')
+		self.clock.now += 5
+		limiter.check('b')
+		self.clock.now += 6
+		limiter.check('c')
+		self.assertEqual(limiter.buckets.keys(), ['b', 'c'])
+
+class AdmissionTest(ServerTestCase):
+	def assertRejected(self, response):
+		self.assertTrue(response.startswith('HTTP/1.0 429'), response)
+		self.assertIn('Retry-After: 1\r\n', response)
+
+	def assertServed(self, response):
+		self.assertTrue(response.startswith('HTTP/1.0 200'), response)
+
+	def checkAddress(self, server):
+		server.admission = AdmissionController(perAddress = RateLimiter(1, burst = 1))
+		self.assertServed(self.get(server, 'rate-test'))
+		self.assertRejected(self.get(server, 'rate-test'))
+		self.assertEqual(server.admission.rejected.count, 1)
+
+	def testAddress(self):
+		self.checkAddress(self.serve(HTTPServer(('127.0.0.1', 0), HTTPHandler)))
+
+	def testAsyncAddress(self):
+		self.checkAddress(self.serve(AsyncHTTPServer(('127.0.0.1', 0), HTTPHandler, workers = 2)))
+
+	def testRoute(self):
+		server = self.serve(HTTPServer(('127.0.0.1', 0), HTTPHandler))
+		server.admission = AdmissionController(perRoute = {'rate-test': RateLimiter(1, burst = 1)})
+		self.assertServed(self.get(server, 'rate-test?a=1'))
+		self.assertRejected(self.get(server, 'rate-test'))
+		self.assertServed(self.get(server, 'rate-other'))
+
+	def testSession(self):
+		server = self.serve(HTTPServer(('127.0.0.1', 0), HTTPHandler))
+		server.admission = AdmissionController(perSession = RateLimiter(1, burst = 1))
+		self.assertServed(self.get(server, 'rate-test', headers = 'Cookie: session=first\r\n'))
+		self.assertRejected(self.get(server, 'rate-test', headers = 'Cookie: session=first\r\n'))
+		self.assertServed(self.get(server, 'rate-test', headers = 'Cookie: session=second\r\n'))
+		# Requests without a session aren't limited per session
+		self.assertServed(self.get(server, 'rate-test'))
+		self.assertServed(self.get(server, 'rate-test'))
+
+if __name__ == '__main__':
+	unittest.main()
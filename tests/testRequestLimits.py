@@ -0,0 +1,74 @@
+import socket
+import time
+import unittest
+
+from support import ServerTestCase
+from rorn.HTTPServer import HTTPServer
+from rorn.HTTPHandler import HTTPHandler, get, post
+from rorn.RequestLimits import RequestLimits
+
+@get('limits-test')
+def limitsTest(handler):
+	print "ok"
+
+@post('limits-test')
+def limitsTestPost(handler, p_a):
+	print p_a
+
+class KeepAliveHandler(HTTPHandler):
+	protocol_version = 'HTTP/1.1'
+
+class RequestLimitsTest(ServerTestCase):
+	def setUp(self):
+		ServerTestCase.setUp(self)
+		self.server = self.serve(HTTPServer(('127.0.0.1', 0), HTTPHandler))
+		self.server.limits = RequestLimits(requestLineTimeout = 1, headerTimeout = 1, bodyTimeout = 1)
+
+	# Each byte arrives well within the timeout, but the phase as a whole doesn't; returns the response and how long it took
+	def trickle(self, prefix, slow):
+		sock = self.connect(self.server)
+		sock.sendall(prefix)
+		start = time.time()
+		try:
+			for c in slow:
+				sock.sendall(c)
+				time.sleep(0.3)
+		except socket.error:
+			pass
+		response = self.receive(sock)
+		sock.close()
+		return response, time.time() - start
+
+	def assertTimedOut(self, (response, elapsed)):
+		self.assertTrue(response.startswith('HTTP/1.0 408'), response)
+		self.assertTrue(elapsed < 3, elapsed)
+
+	def testTrickledRequestLine(self):
+		self.assertTimedOut(self.trickle('', 'GET /limits-test HTTP/1.0\r\n\r\n'))
+
+	def testTrickledHeaders(self):
+		self.assertTimedOut(self.trickle('GET /limits-test HTTP/1.0\r\n', 'X-Slow: ' + 'x' * 20))
+
+	def testTrickledBody(self):
+		self.assertTimedOut(self.trickle('POST /limits-test HTTP/1.0\r\nContent-Type: application/x-www-form-urlencoded\r\nContent-Length: 30\r\n\r\n', 'a=' + 'x' * 28))
+
+	# The next request line on a kept-alive connection has a deadline of its own
+	def testIdleKeepAlive(self):
+		server = self.serve(HTTPServer(('127.0.0.1', 0), KeepAliveHandler))
+		server.limits = RequestLimits(requestLineTimeout = 1, headerTimeout = 1, bodyTimeout = 1)
+		sock = self.connect(server)
+		sock.sendall('GET /limits-test HTTP/1.1\r\nHost: localhost\r\n\r\n')
+		start = time.time()
+		response = self.receive(sock)
+		sock.close()
+		self.assertTrue(response.startswith('HTTP/1.1 200'), response)
+		self.assertTrue('ok\nHTTP/1.1 408' in response, response)
+		self.assertTrue(time.time() - start < 3)
+
+	def testCompleteRequest(self):
+		response = self.request(self.server, 'POST /limits-test HTTP/1.0\r\nContent-Type: application/x-www-form-urlencoded\r\nContent-Length: 3\r\n\r\na=b')
+		self.assertTrue(response.startswith('HTTP/1.0 200'), response)
+		self.assertTrue(response.endswith('b\n'), response)
+
+if __name__ == '__main__':
+	unittest.main()
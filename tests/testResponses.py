@@ -0,0 +1,50 @@
+import unittest
+
+from support import ServerTestCase
+from rorn.AsyncServer import AsyncHTTPServer
+from rorn.HTTPServer import HTTPServer
+from rorn.HTTPHandler import HTTPHandler, get
+
+@get('responses-test')
+def responsesTest(handler):
+	print "body"
+
+@get('responses-unicode')
+def responsesUnicode(handler):
+	print u'caf\xe9'
+
+class CustomHandler(HTTPHandler):
+	server_version = 'Custom/1.0'
+	protocol_version = 'HTTP/1.1'
+
+class ResponsesTest(ServerTestCase):
+	def get(self, handlerClass, method = 'GET'):
+		server = self.serve(HTTPServer(('127.0.0.1', 0), handlerClass))
+		return ServerTestCase.get(self, server, 'responses-test', method)
+
+	def testGet(self):
+		head, body = self.get(HTTPHandler).split('\r\n\r\n', 1)
+		self.assertTrue(head.startswith('HTTP/1.0 200 OK\r\n'), head)
+		self.assertTrue('\r\nContent-Length: 5\r\n' in head + '\r\n', head)
+		self.assertEqual(body, 'body\n')
+
+	def testHead(self):
+		head, body = self.get(HTTPHandler, 'HEAD').split('\r\n\r\n', 1)
+		self.assertTrue('\r\nContent-Length: 5\r\n' in head + '\r\n', head)
+		self.assertEqual(body, '')
+
+	def testUnicode(self):
+		for server in (self.serve(HTTPServer(('127.0.0.1', 0), HTTPHandler)), self.serve(AsyncHTTPServer(('127.0.0.1', 0), HTTPHandler))):
+			head, body = ServerTestCase.get(self, server, 'responses-unicode').split('\r\n\r\n', 1)
+			self.assertEqual(body, 'caf\xc3\xa9\n')
+			self.assertTrue('\r\nContent-Length: 6\r\n' in head + '\r\n', head)
+
+	# Status lines are cached, but per handler class
+	def testSubclassStatusLine(self):
+		self.assertTrue('\r\nServer: BaseHTTP/' in self.get(HTTPHandler))
+		response = self.get(CustomHandler)
+		self.assertTrue(response.startswith('HTTP/1.1 200 OK\r\n'), response)
+		self.assertTrue('\r\nServer: Custom/1.0 ' in response, response)
+
+if __name__ == '__main__':
+	unittest.main()
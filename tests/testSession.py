@@ -0,0 +1,130 @@
+import unittest
+
+from support import ServerTestCase
+from rorn import Session
+from rorn.AsyncServer import AsyncHTTPServer
+from rorn.HTTPServer import HTTPServer
+from rorn.HTTPHandler import HTTPHandler, get, stream
+from rorn.Session import SessionView, SessionConflict
+from rorn.utils import redirect
+
+# Writes 'other' straight to the stored session, as a concurrent request would, before writing 'mine' through the view
+def conflictingWrite(handler):
+	handler.session.session['value'] = 'other'
+	handler.session['value'] = 'mine'
+
+@get('session-conflict')
+def conflictPage(handler):
+	conflictingWrite(handler)
+	print 'page'
+
+@get('session-conflict-redirect')
+def conflictRedirect(handler):
+	conflictingWrite(handler)
+	redirect('/elsewhere')
+
+@stream('session-conflict-stream', channels = 'session-conflict')
+def conflictStream(handler):
+	conflictingWrite(handler)
+	yield 'event'
+
+class ErrorOnConflictHandler(HTTPHandler):
+	sessionConflicts = 'error'
+
+class SessionViewTest(ServerTestCase):
+	def setUp(self):
+		ServerTestCase.setUp(self)
+		self.saves = []
+		self.serializer = Session.serializer
+		save = self.serializer.save
+		def countingSave(key):
+			self.saves.append(key)
+			save(key)
+		self.serializer.save = countingSave
+		self.session = Session.Session('test')
+
+	def tearDown(self):
+		del self.serializer.save
+		ServerTestCase.tearDown(self)
+
+	def testWritesCommitTogether(self):
+		view = SessionView(self.session)
+		for i in range(5):
+			view['k%d' % i] = i
+		self.assertEqual(view['k4'], 4)
+		self.assertEqual(self.session['k4'], None)
+		view.commit()
+		self.assertEqual(sorted(self.session.keys()), ['k0', 'k1', 'k2', 'k3', 'k4'])
+		self.assertEqual(len(self.saves), 1)
+
+	def testWritesAfterCommit(self):
+		view = SessionView(self.session)
+		view.commit()
+		view['late'] = 1
+		self.assertEqual(self.session['late'], 1)
+		del view['late']
+		self.assertFalse('late' in self.session)
+
+	def testDiscard(self):
+		view = SessionView(self.session)
+		view['written'] = 1
+		view.discard()
+		view.commit()
+		self.assertFalse('written' in self.session)
+		self.assertFalse('written' in view)
+
+	def conflict(self, policy):
+		self.session['a'] = 0
+		first, second = SessionView(self.session, policy), SessionView(self.session, policy)
+		first['a'] = 1
+		second['a'] = 2
+		second['b'] = 2
+		first.commit()
+		second.commit()
+
+	def testMerge(self):
+		self.conflict('merge')
+		self.assertEqual((self.session['a'], self.session['b']), (2, 2))
+
+	def testKeep(self):
+		self.conflict('keep')
+		self.assertEqual((self.session['a'], self.session['b']), (1, 2))
+
+	def testError(self):
+		self.assertRaises(SessionConflict, self.conflict, 'error')
+		self.assertEqual((self.session['a'], self.session['b']), (1, None))
+
+	def testIterationIsACopy(self):
+		self.session['a'] = 1
+		keys = iter(self.session)
+		self.session['b'] = 2
+		self.assertEqual(list(keys), ['a'])
+
+class SessionConflictTest(ServerTestCase):
+	def assertConflict(self, server, path):
+		response = self.get(server, path)
+		self.assertTrue(response.startswith('HTTP/1.0 409'), response)
+		self.assertTrue('changed by another request' in response, response)
+		key = response.split('Set-Cookie: session=', 1)[1].split(';', 1)[0]
+		self.assertEqual(Session.Session.load(key)['value'], 'other')
+
+	def testPage(self):
+		self.assertConflict(self.serve(HTTPServer(('127.0.0.1', 0), ErrorOnConflictHandler)), 'session-conflict')
+
+	def testRedirect(self):
+		self.assertConflict(self.serve(HTTPServer(('127.0.0.1', 0), ErrorOnConflictHandler)), 'session-conflict-redirect')
+
+	def testStream(self):
+		self.assertConflict(self.serve(HTTPServer(('127.0.0.1', 0), ErrorOnConflictHandler)), 'session-conflict-stream')
+
+	def testEventLoop(self):
+		self.assertConflict(self.serve(AsyncHTTPServer(('127.0.0.1', 0), ErrorOnConflictHandler, workers = 2)), 'session-conflict')
+
+	def testMerge(self):
+		response = self.get(self.serve(HTTPServer(('127.0.0.1', 0), HTTPHandler)), 'session-conflict')
+		self.assertTrue(response.startswith('HTTP/1.0 200'), response)
+		key = response.split('Set-Cookie: session=', 1)[1].split(';', 1)[0]
+		self.assertEqual(Session.Session.load(key)['value'], 'mine')
+
+if __name__ == '__main__':
+	unittest.main()
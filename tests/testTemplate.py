@@ -0,0 +1,50 @@
+import unittest
+
+import support # Puts rorn on the path
+from rorn import Template as templateModule
+from rorn.Template import Template, TemplateError, getTemplate, render
+
+class TemplateTest(unittest.TestCase):
+	def testText(self):
+		self.assertEqual(render('plain <b>text</b>'), 'plain <b>text</b>')
+		self.assertEqual(render(''), '')
+
+	def testEscaping(self):
+		value = '<a href="x">\'&\'</a>'
+		self.assertEqual(render('{{v}}', v = value), '&lt;a href=&quot;x&quot;&gt;&#39;&amp;&#39;&lt;/a&gt;')
+		self.assertEqual(render('{{{v}}}', v = value), value)
+		self.assertEqual(render('<p>{{ v }}</p>', v = 3), '<p>3</p>')
+		self.assertEqual(render('{{get-args}}', **{'get-args': 'a&b'}), 'a&amp;b')
+
+	def testMissingVariable(self):
+		self.assertRaises(KeyError, render, '{{v}}')
+		self.assertRaises(KeyError, render, '{{{v}}}')
+
+	def testSections(self):
+		source = '{{#items}}has {{items}}{{/items}}{{^items}}none{{/items}}'
+		self.assertEqual(render(source, items = 2), 'has 2')
+		self.assertEqual(render(source, items = 0), 'none')
+		self.assertEqual(render(source, items = []), 'none')
+		# A missing name is false
+		self.assertEqual(render(source), 'none')
+
+	def testNestedSections(self):
+		source = '[{{#a}}a{{#b}}b{{/b}}{{^b}}!b{{/b}}{{/a}}]'
+		self.assertEqual(render(source, a = True, b = True), '[ab]')
+		self.assertEqual(render(source, a = True, b = False), '[a!b]')
+		self.assertEqual(render(source, a = False, b = True), '[]')
+
+	def testErrors(self):
+		self.assertRaises(TemplateError, Template, '{{#a}}unclosed')
+		self.assertRaises(TemplateError, Template, '{{^a}}unclosed')
+		self.assertRaises(TemplateError, Template, 'stray {{/a}}')
+		self.assertRaises(TemplateError, Template, '{{#a}}{{#b}}{{/a}}{{/b}}')
+
+	def testCache(self):
+		source = '<i>{{v}}</i>'
+		self.assertIs(getTemplate(source), getTemplate(source))
+		self.assertIn(source, templateModule.templates)
+		self.assertEqual(getTemplate(source)(v = 1), '<i>1</i>')
+
+if __name__ == '__main__':
+	unittest.main()
@@ -1,12 +1,24 @@
-from bleach import clean
-import cgi
 import hashlib
 from os.path import dirname
 import sys
+import time
 import traceback
 
+# Imports name from module the first time it's needed and keeps it, for things that shouldn't slow down startup.
+# An import statement in the function instead would take the global import lock on every call
+lazyImports = {}
+def lazyImport(module, name):
+	try:
+		return lazyImports[module, name]
+	except KeyError:
+		value = lazyImports[module, name] = getattr(__import__(module, globals(), {}, [name]), name)
+		return value
+
+def clean(text, *args, **kw):
+	return lazyImport('bleach', 'clean')(text, *args, **kw)
+
 def stripTags(value):
-	return cgi.escape(value, True)
+	return lazyImport('cgi', 'escape')(value, True)
 
 class DoneRendering(Exception): pass
 def done():
@@ -18,6 +30,20 @@ class Redirect(Exception):
 def redirect(target):
 	raise Redirect(target)
 
+# RFC 1123 date for HTTP headers. Formatting it shows up on every response, so it's only redone when the second changes
+weekdays = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+months = [None, 'Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+lastDate = (None, None)
+def httpDate():
+	global lastDate
+	now = int(time.time())
+	second, formatted = lastDate
+	if second != now:
+		year, month, day, hh, mm, ss, wd, _, _ = time.gmtime(now)
+		formatted = "%s, %02d %s %d %02d:%02d:%02d GMT" % (weekdays[wd], day, months[month], year, hh, mm, ss)
+		lastDate = (now, formatted)
+	return formatted
+
 def md5(str):
 	return hashlib.md5(str).hexdigest()
 
@@ -44,9 +70,8 @@ def formatException():
 	return "<b>%s: %s</b><br><br>%s" % (clean(type.__name__), clean(str(e)).replace('\n', '<br>'), formatTrace(traceback.extract_tb(tb)))
 
 def formatTrace(frames):
-	from code import highlightCode
-	from ResponseWriter import ResponseWriter
-	writer = ResponseWriter()
+	highlightCode = lazyImport('code', 'highlightCode')
+	writer = lazyImport('ResponseWriter', 'ResponseWriter')()
 	base = basePath()
 	lpad = len(base) + 1
 	print "<div class=\"code_default light\" style=\"padding: 4px\">"